@@ -1,113 +1,90 @@
 import numpy as np
 import time
 
+from instance_io import read_input
+from instrumentation import phase
+from similarity import pair_from_index, upper_triangle
 
-def read_input(file_name):
-    # Reading the input file
-    with open(file_name, 'r') as file:
-        lines = file.readlines()
 
-    # Parsing the first line to get N, K, and Mk values
-    first_line = list(map(int, lines[0].strip().split()))
-    N = first_line[0]  # Numero di oggetti
-    K = first_line[1]  # Numero di cluster
-    Mk = first_line[2:]  # Dimensione di ciascun cluster
-
-    # Parsing the similarity matrix
-    s = np.zeros((N, N))
-    for i in range(1, N + 1):
-        values = list(map(float, lines[i].strip().split()))
-        for j, value in enumerate(values, start=i):
-            s[i - 1, j] = value
-            s[j, i - 1] = value
-
-    return N, K, Mk, s
-
-
-def constructive_heuristic(N, K, Mk, s, time_limit=60):
+def constructive_heuristic(N, K, Mk, s, time_limit=60, trace=None):
+    # trace: optional instrumentation.Trace for the incumbent trace and phase times
     start_time = time.time()
-    best_objective_value = -np.inf
     improving_swaps = 0
 
     # Calculate similarity sum for each object and sort in descending order
-    similarity_sums = [(i, np.sum(s[i])) for i in range(N)]
-    similarity_sums.sort(key=lambda x: x[1], reverse=True)
+    order = np.argsort(-s.sum(axis=1), kind='stable')
+    rank = np.argsort(order)
+    available = np.ones(N, dtype=bool)
 
     # Initialize empty clusters
     clusters = [[] for _ in range(K)]
 
-    # Start with the most compatible object pair (maximum sij)
-    sorted_items = [i[0] for i in similarity_sums]
-
-    # For the first cluster, select the most compatible pair
-    max_similarity_pair = (-1, -1)
-    max_similarity_value = -1
-    for i in range(N):
-        for j in range(i + 1, N):
-            if s[sorted_items[i], sorted_items[j]] > max_similarity_value:
-                max_similarity_value = s[sorted_items[i], sorted_items[j]]
-                max_similarity_pair = (sorted_items[i], sorted_items[j])
+    # For the first cluster, select the most compatible pair (maximum sij)
+    with phase(trace, 'seed selection'):
+        i, j = pair_from_index(N, np.argmax(upper_triangle(s)))
+        if rank[i] > rank[j]:
+            i, j = j, i
 
     # Add the pair to the first cluster and remove them from the list
-    clusters[0].append(max_similarity_pair[0])
-    clusters[0].append(max_similarity_pair[1])
-    sorted_items.remove(max_similarity_pair[0])
-    sorted_items.remove(max_similarity_pair[1])
-
-    # Add other objects that maximize the objective
-    for cluster_index in range(K):
-        while len(clusters[cluster_index]) < Mk[cluster_index]:
-            current_time = time.time()
-            if current_time - start_time >= time_limit:
-                # Stop the algorithm if time has expired
-                break
-
-            best_item = None
-            best_increase = -1
-            for item in sorted_items:
-                increase = sum(s[item][c] for c in clusters[cluster_index])
-                if increase > best_increase:
-                    best_increase = increase
-                    best_item = item
-            if best_item is not None:
-                clusters[cluster_index].append(best_item)
-                sorted_items.remove(best_item)
+    clusters[0] += [i, j]
+    available[[i, j]] = False
 
-    # Improvement phase with item swapping
-    for item in sorted_items:
+    with phase(trace, 'greedy fill'):
+        # Add other objects that maximize the objective, keeping a running affinity
+        # of every object to the cluster being built
         for cluster_index in range(K):
-            for cluster_item in clusters[cluster_index]:
+            affinity = s[:, clusters[cluster_index]].sum(axis=1)
+            while len(clusters[cluster_index]) < Mk[cluster_index] and available.any():
                 current_time = time.time()
                 if current_time - start_time >= time_limit:
                     # Stop the algorithm if time has expired
                     break
 
-                current_value = sum(s[cluster_item][c] for c in clusters[cluster_index])
-                new_value = sum(s[item][c] for c in clusters[cluster_index] if c != cluster_item)
-                if new_value > current_value:
-                    # Improving swap
-                    clusters[cluster_index].remove(cluster_item)
-                    clusters[cluster_index].append(item)
-                    sorted_items.remove(item)
-                    sorted_items.append(cluster_item)
-                    improving_swaps += 1
+                candidates = np.where(available[order], affinity[order], -np.inf)
+                best_item = int(order[np.argmax(candidates)])
+                clusters[cluster_index].append(best_item)
+                available[best_item] = False
+                affinity += s[best_item]
+
+    sorted_items = [int(item) for item in order if available[item]]
+
+    # Objective of the construction, updated with the gain of every improving swap
+    objective_value = sum(s[np.ix_(cluster, cluster)].sum() / 2 for cluster in clusters)
+    time_to_best = time.time() - start_time
+    if trace is not None:
+        trace.record(objective_value, 'construction', 0)
+
+    with phase(trace, 'outside swaps'):
+        # Improvement phase with item swapping
+        for item in sorted_items:
+            swapped = False
+            for cluster_index in range(K):
+                for cluster_item in clusters[cluster_index]:
+                    current_time = time.time()
+                    if current_time - start_time >= time_limit:
+                        # Stop the algorithm if time has expired
+                        break
+
+                    current_value = sum(s[cluster_item, c] for c in clusters[cluster_index])
+                    new_value = sum(s[item, c] for c in clusters[cluster_index] if c != cluster_item)
+                    if new_value > current_value:
+                        # Improving swap
+                        clusters[cluster_index].remove(cluster_item)
+                        clusters[cluster_index].append(item)
+                        sorted_items.remove(item)
+                        sorted_items.append(cluster_item)
+                        improving_swaps += 1
+                        swapped = True
+                        objective_value += new_value - current_value
+                        time_to_best = time.time() - start_time
+                        if trace is not None:
+                            trace.record(objective_value, 'outside swap', improving_swaps)
+                        break
+                if swapped:
+                    # item is now inside a cluster, move on to the next outside item
                     break
 
-    # Calculate the final objective function value
-    objective_value = 0
-    for cluster_index in range(K):
-        for i in range(len(clusters[cluster_index])):
-            for j in range(i + 1, len(clusters[cluster_index])):
-                objective_value += s[clusters[cluster_index][i]][clusters[cluster_index][j]]
-
-    # Check if the found solution is the best so far
-    if objective_value > best_objective_value:
-        best_objective_value = objective_value
-
-    end_time = time.time()
-    time_to_best = end_time - start_time
-
-    return clusters, best_objective_value, improving_swaps, time_to_best
+    return clusters, objective_value, improving_swaps, time_to_best
 
 
 def write_output(file_name, instance_name, objective_value, improving_swaps, time_to_best, total_time):
@@ -2,150 +2,115 @@ import numpy as np
 import time
 import random
 
-
-def read_input(file_name):
-    # Reading the input file
-    with open(file_name, 'r') as file:
-        lines = file.readlines()
-
-    # Parsing the first line to get N, K, and Mk values
-    first_line = list(map(int, lines[0].strip().split()))
-    N = first_line[0]  # Numero di oggetti
-    K = first_line[1]  # Numero di cluster
-    Mk = first_line[2:]  # Dimensione di ciascun cluster
-
-    # Parsing the similarity matrix
-    s = np.zeros((N, N))
-    for i in range(1, N + 1):
-        values = list(map(float, lines[i].strip().split()))
-        for j, value in enumerate(values, start=i):
-            s[i - 1, j] = value
-            s[j, i - 1] = value
-
-    return N, K, Mk, s
-
-
-def constructive_heuristic(N, K, Mk, s, time_limit=600):
+from bounds import gap_closed, optimality_gap, upper_bound as compute_upper_bound
+import kernels
+from instance_io import read_input
+from instrumentation import phase
+from similarity import SparseSimilarity, item_pair_indices, pair_from_index, upper_triangle
+
+# Minimum gain for a move to count as improving (guards against float round-off cycles)
+IMPROVEMENT_TOLERANCE = 1e-9
+# Cells of the move-gain block evaluated at once by SwapState.best_move
+MOVE_BLOCK_CELLS = 1 << 22
+# Moves applied per compiled kernel call between deadline checks
+KERNEL_MOVES = 64
+# assignment value of items deleted from the instance (incremental solver); -1 = outside any cluster
+REMOVED = -2
+
+
+def constructive_heuristic(N, K, Mk, s, time_limit=600, search='best', upper_bound=None, gap_tolerance=0.0,
+                           trace=None):
+    # search: 'best' or 'first' scan the whole swap neighbourhood with NumPy,
+    # 'random' keeps the original sampled swaps between clusters.
+    # With an upper_bound the search stops once the optimality gap is at most gap_tolerance.
+    # trace: optional instrumentation.Trace for the incumbent trace and phase times
     start_time = time.time()
 
-    # Calculate similarity sum for each object and sort in descending order
-    similarity_sums = [(i, np.sum(s[i])) for i in range(N)]
-    similarity_sums.sort(key=lambda x: x[1], reverse=True)
-
-    # Initialize empty clusters
-    clusters = [[] for _ in range(K)]
-
-    # Sort objects by similarity sum
-    sorted_items = [i[0] for i in similarity_sums]
-
-    # Select the most compatible object pairs to start clusters
-    pairs_used = set()
-    for cluster_index in range(K):
-        max_similarity_pair = (-1, -1)
-        max_similarity_value = -1
-        for i in range(len(sorted_items)):
-            for j in range(i + 1, len(sorted_items)):
-                if sorted_items[i] not in pairs_used and sorted_items[j] not in pairs_used:
-                    if s[sorted_items[i], sorted_items[j]] > max_similarity_value:
-                        max_similarity_value = s[sorted_items[i], sorted_items[j]]
-                        max_similarity_pair = (sorted_items[i], sorted_items[j])
-
-        clusters[cluster_index].append(max_similarity_pair[0])
-        clusters[cluster_index].append(max_similarity_pair[1])
-        pairs_used.add(max_similarity_pair[0])
-        pairs_used.add(max_similarity_pair[1])
-
-    # Remove used pairs from the list of objects
-    sorted_items = [item for item in sorted_items if item not in pairs_used]
-
-    # Add other objects that maximize the objective
-    for cluster_index in range(K):
-        while len(clusters[cluster_index]) < Mk[cluster_index]:
-            best_item = None
-            best_increase = -1
-            for item in sorted_items:
-                increase = sum(s[item][c] for c in clusters[cluster_index])
-                if increase > best_increase:
-                    best_increase = increase
-                    best_item = item
-            if best_item is not None:
-                clusters[cluster_index].append(best_item)
-                sorted_items.remove(best_item)
+    clusters, sorted_items = greedy_construction(N, K, Mk, s, trace=trace)
 
     # Swaps within clusters
     cluster_swaps = 0
     outside_swaps = 0
     total_swaps = 0
-    best_objective_value = compute_objective(clusters, s)
+    state = SwapState(s, clusters, sorted_items)
+    best_objective_value = state.objective
     time_to_best = 0
+    if trace is not None:
+        trace.record(state.objective, 'construction', 0)
+
+    # Deterministic local search over all inter-cluster and in/out swaps
+    if search != 'random':
+        with phase(trace, 'local search'):
+            cluster_swaps, outside_swaps, last_move_time = local_search(state, start_time + time_limit,
+                                                                        first_improvement=search == 'first',
+                                                                        trace=trace, upper_bound=upper_bound,
+                                                                        gap_tolerance=gap_tolerance)
+        total_swaps = cluster_swaps + outside_swaps
+        if total_swaps:
+            best_objective_value = state.objective
+            time_to_best = last_move_time - start_time
+
+    # Original sampled swaps, only for search='random'
+    if search == 'random':
+        with phase(trace, 'inter-cluster swaps'):
+            while K > 1 and time.time() - start_time < time_limit and \
+                    not gap_closed(best_objective_value, upper_bound, gap_tolerance):
+                improvement_found = False
+                for _ in range(100):  # Perform 100 random swap attempts between clusters
+                    cluster_a, cluster_b = random.sample(range(K), 2)
+                    if clusters[cluster_a] and clusters[cluster_b]:
+                        item_a = random.choice(clusters[cluster_a])
+                        item_b = random.choice(clusters[cluster_b])
+
+                        # Evaluate if the swap improves the objective function
+                        if state.swap_gain(item_a, item_b) > 0:
+                            # Improving swap between clusters
+                            state.apply_swap(item_a, item_b)
+                            cluster_swaps += 1
+                            total_swaps += 1
+                            improvement_found = True
+                            if trace is not None:
+                                trace.record(state.objective, 'cluster swap', total_swaps)
+
+                # Update the best objective function value
+                if state.objective > best_objective_value:
+                    best_objective_value = state.objective
+                    time_to_best = time.time() - start_time
+
+                # Stop if no improvements found after many attempts
+                if not improvement_found:
+                    break
 
-    while time.time() - start_time < time_limit:
-        improvement_found = False
-        for _ in range(100):  # Perform 100 random swap attempts between clusters
-            cluster_a, cluster_b = random.sample(range(K), 2)
-            if clusters[cluster_a] and clusters[cluster_b]:
-                item_a = random.choice(clusters[cluster_a])
-                item_b = random.choice(clusters[cluster_b])
-
-                # Evaluate if the swap improves the objective function
-                current_value_a = sum(s[item_a][c] for c in clusters[cluster_a] if c != item_a)
-                current_value_b = sum(s[item_b][c] for c in clusters[cluster_b] if c != item_b)
-
-                new_value_a = sum(s[item_b][c] for c in clusters[cluster_a])
-                new_value_b = sum(s[item_a][c] for c in clusters[cluster_b])
-
-                if new_value_a + new_value_b > current_value_a + current_value_b:
-                    # Improving swap between clusters
-                    clusters[cluster_a].remove(item_a)
-                    clusters[cluster_a].append(item_b)
-                    clusters[cluster_b].remove(item_b)
-                    clusters[cluster_b].append(item_a)
-                    cluster_swaps += 1
-                    total_swaps += 1
-                    improvement_found = True
-
-        # Update the best objective function value
-        current_objective_value = compute_objective(clusters, s)
-        if current_objective_value > best_objective_value:
-            best_objective_value = current_objective_value
-            time_to_best = time.time() - start_time
-
-        # Stop if no improvements found after many attempts
-        if not improvement_found:
-            break
-
-    # Swaps with objects outside clusters
-    while time.time() - start_time < time_limit:
-        improvement_found = False
-        for item in sorted_items:
-            for cluster_index in range(K):
-                for cluster_item in clusters[cluster_index]:
-                    current_value = sum(s[cluster_item][c] for c in clusters[cluster_index])
-                    new_value = sum(s[item][c] for c in clusters[cluster_index] if c != cluster_item)
-                    if new_value > current_value:
-                        # Improving swap with objects outside clusters
-                        clusters[cluster_index].remove(cluster_item)
-                        clusters[cluster_index].append(item)
-                        sorted_items.remove(item)
-                        sorted_items.append(cluster_item)
-                        outside_swaps += 1
-                        total_swaps += 1
-                        improvement_found = True
+        # Swaps with objects outside clusters
+        with phase(trace, 'outside swaps'):
+            while time.time() - start_time < time_limit and \
+                    not gap_closed(best_objective_value, upper_bound, gap_tolerance):
+                improvement_found = False
+                for item in sorted_items:
+                    for cluster_index in range(K):
+                        for cluster_item in clusters[cluster_index]:
+                            if state.swap_gain(item, cluster_item) > 0:
+                                # Improving swap with objects outside clusters
+                                state.apply_swap(item, cluster_item)
+                                outside_swaps += 1
+                                total_swaps += 1
+                                improvement_found = True
+                                if trace is not None:
+                                    trace.record(state.objective, 'outside swap', total_swaps)
+                                break
+                        if improvement_found:
+                            break
+                    if improvement_found:
                         break
-                if improvement_found:
-                    break
-            if improvement_found:
-                break
 
-        # Update the best objective function value
-        current_objective_value = compute_objective(clusters, s)
-        if current_objective_value > best_objective_value:
-            best_objective_value = current_objective_value
-            time_to_best = time.time() - start_time
+                # Update the best objective function value
+                if state.objective > best_objective_value:
+                    best_objective_value = state.objective
+                    time_to_best = time.time() - start_time
 
-        # Exit if no improvements are found
-        if not improvement_found:
-            break
+                # Exit if no improvements are found
+                if not improvement_found:
+                    break
 
     # Total execution time
     total_time = time.time() - start_time
@@ -153,16 +118,337 @@ def constructive_heuristic(N, K, Mk, s, time_limit=600):
     return clusters, best_objective_value, cluster_swaps, outside_swaps, total_swaps, time_to_best, total_time
 
 
+def tabu_search(N, K, Mk, s, time_limit=600, tenure=None, max_iterations=None, seed=None, upper_bound=None,
+                gap_tolerance=0.0, trace=None):
+    # Tabu search over the swap neighbourhood, starting from the constructive heuristic's local optimum.
+    # After a swap, neither item may return to the cluster (or the outside) it left for a random
+    # tenure in [tenure, 2 * tenure] iterations, unless the move beats the best objective (aspiration).
+    # With an upper_bound the search stops once the optimality gap is at most gap_tolerance.
+    start_time = time.time()
+    deadline = start_time + time_limit
+    rng = np.random.default_rng(seed)
+    if tenure is None:
+        tenure = max(5, int(np.sqrt(N)))
+
+    clusters, sorted_items = greedy_construction(N, K, Mk, s, trace=trace)
+    state = SwapState(s, clusters, sorted_items)
+    if trace is not None:
+        trace.record(state.objective, 'construction', 0)
+    with phase(trace, 'local search'):
+        cluster_swaps, outside_swaps, _ = local_search(state, deadline, trace=trace, upper_bound=upper_bound,
+                                                       gap_tolerance=gap_tolerance)
+    best_objective_value = state.objective
+    best_assignment = state.assignment.copy()
+    time_to_best = time.time() - start_time
+
+    # tabu_until[i, k + 1]: first iteration at which item i may return to cluster k (column 0 = outside)
+    tabu_until = np.zeros((N, K + 1), dtype=np.int64)
+    iteration = 0
+    with phase(trace, 'tabu search'):
+        while time.time() < deadline and (max_iterations is None or iteration < max_iterations) and \
+                not gap_closed(best_objective_value, upper_bound, gap_tolerance):
+            iteration += 1
+            move = _best_tabu_move(state, tabu_until > iteration, best_objective_value)
+            if move is None:
+                # Empty neighbourhood (e.g. K = 1 and every item clustered)
+                break
+            item_a, item_b = move
+            tabu_until[item_a, state.assignment[item_a] + 1] = iteration + rng.integers(tenure, 2 * tenure + 1)
+            tabu_until[item_b, state.assignment[item_b] + 1] = iteration + rng.integers(tenure, 2 * tenure + 1)
+            move_type = 'cluster swap' if state.assignment[item_b] >= 0 else 'outside swap'
+            if state.assignment[item_b] >= 0:
+                cluster_swaps += 1
+            else:
+                outside_swaps += 1
+            state.apply_swap(item_a, item_b)
+
+            if state.objective > best_objective_value + IMPROVEMENT_TOLERANCE:
+                best_objective_value = state.objective
+                best_assignment = state.assignment.copy()
+                time_to_best = time.time() - start_time
+                if trace is not None:
+                    trace.record(best_objective_value, 'tabu ' + move_type, cluster_swaps + outside_swaps)
+
+    clusters = [np.flatnonzero(best_assignment == cluster_index).tolist() for cluster_index in range(K)]
+    total_time = time.time() - start_time
+    return (clusters, compute_objective(clusters, s), cluster_swaps, outside_swaps, cluster_swaps + outside_swaps,
+            time_to_best, total_time)
+
+
+def _best_tabu_move(state, tabu, best_objective_value):
+    # Best swap that is not tabu or beats best_objective_value (aspiration); the best swap overall if
+    # the whole neighbourhood is tabu; None if there is no swap at all. Scanned in blocks of clustered
+    # items like SwapState.best_move.
+    # tabu[i, k + 1]: item i may not move to cluster k (column 0 = outside)
+    clustered = np.flatnonzero(state.assignment >= 0)
+    block_size = max(1, MOVE_BLOCK_CELLS // len(state.assignment))
+    column_clusters = state.assignment + 1
+    best_allowed = (-np.inf, None, None)
+    best_overall = (-np.inf, None, None)
+    for start in range(0, len(clustered), block_size):
+        rows, gains = state.move_gains(clustered[start:start + block_size])
+        row_clusters = state.assignment[rows] + 1
+        forbidden = tabu[rows][:, column_clusters] | tabu[:, row_clusters].T
+        aspiration = state.objective + gains > best_objective_value + IMPROVEMENT_TOLERANCE
+        allowed = np.where(forbidden & ~aspiration, -np.inf, gains)
+        row, item_b = np.unravel_index(np.argmax(allowed), gains.shape)
+        if allowed[row, item_b] > best_allowed[0]:
+            best_allowed = (allowed[row, item_b], rows[row], item_b)
+        row, item_b = np.unravel_index(np.argmax(gains), gains.shape)
+        if gains[row, item_b] > best_overall[0]:
+            best_overall = (gains[row, item_b], rows[row], item_b)
+    if not np.isfinite(best_overall[0]):
+        return None
+    if np.isfinite(best_allowed[0]):
+        return best_allowed[1:]
+    # Aspiration by default: the whole neighbourhood is tabu, take the best move anyway
+    return best_overall[1:]
+
+
+def local_search(state, deadline, first_improvement=False, trace=None, backend=None, upper_bound=None,
+                 gap_tolerance=0.0):
+    # Apply improving swaps until a local optimum or the deadline, recording each one in trace.
+    # With an upper_bound it also stops once the optimality gap is at most gap_tolerance.
+    # Returns the number of cluster and outside swaps and the time of the last one.
+    # backend: 'numpy' (vectorized SwapState.best_move) or 'kernel' (kernels.search, compiled when
+    # numba is installed); default kernels.DEFAULT_BACKEND, or kernels.FIRST_IMPROVEMENT_BACKEND
+    # with first_improvement. The kernel needs a dense ndarray s.
+    if backend is None:
+        backend = kernels.FIRST_IMPROVEMENT_BACKEND if first_improvement else kernels.DEFAULT_BACKEND
+    if backend == 'kernel' and isinstance(state.s, np.ndarray):
+        return _kernel_local_search(state, deadline, first_improvement, trace, upper_bound, gap_tolerance)
+    cluster_swaps = 0
+    outside_swaps = 0
+    last_move_time = None
+    while time.time() < deadline and not gap_closed(state.objective, upper_bound, gap_tolerance):
+        gain, item_a, item_b = state.best_move(first_improvement=first_improvement)
+        if gain <= IMPROVEMENT_TOLERANCE:
+            break
+        move_type = 'cluster swap' if state.assignment[item_b] >= 0 else 'outside swap'
+        if state.assignment[item_b] >= 0:
+            cluster_swaps += 1
+        else:
+            outside_swaps += 1
+        state.apply_swap(item_a, item_b)
+        last_move_time = time.time()
+        if trace is not None:
+            trace.record(state.objective, move_type, cluster_swaps + outside_swaps)
+    return cluster_swaps, outside_swaps, last_move_time
+
+
+def _kernel_local_search(state, deadline, first_improvement=False, trace=None, upper_bound=None, gap_tolerance=0.0):
+    # local_search on the assignment array and slot/position index of kernels.py; the
+    # state's cluster lists are rebuilt from the slots at the end. The deadline and the gap
+    # are checked between kernel calls, so with a trace or an upper_bound each call makes one move
+    s = np.ascontiguousarray(state.s, dtype=np.float64)
+    slots, position, offsets = kernels.slot_index(state.clusters, state.outside_items, len(s))
+    max_moves = 1 if trace is not None or upper_bound is not None else KERNEL_MOVES
+    cluster_swaps = 0
+    outside_swaps = 0
+    last_move_time = None
+    while time.time() < deadline and not gap_closed(state.objective, upper_bound, gap_tolerance):
+        new_cluster_swaps, new_outside_swaps, delta, local_optimum = kernels.search(
+            s, state.gain, state.assignment, slots, position, first_improvement, max_moves, IMPROVEMENT_TOLERANCE)
+        if new_cluster_swaps + new_outside_swaps:
+            cluster_swaps += new_cluster_swaps
+            outside_swaps += new_outside_swaps
+            state.objective += delta
+            last_move_time = time.time()
+            if trace is not None:
+                trace.record(state.objective, 'cluster swap' if new_cluster_swaps else 'outside swap',
+                             cluster_swaps + outside_swaps)
+        if local_optimum:
+            break
+    for cluster_index, cluster in enumerate(state.clusters):
+        cluster[:] = slots[offsets[cluster_index]:offsets[cluster_index + 1]].tolist()
+    state.outside_items[:] = slots[offsets[-1]:].tolist()
+    return cluster_swaps, outside_swaps, last_move_time
+
+
+def perturb(state, strength, rng):
+    # Random kick: strength swaps between a clustered item and an item of another cluster or outside
+    for _ in range(strength):
+        inside = np.flatnonzero(state.assignment >= 0)
+        item_a = rng.choice(inside)
+        candidates = np.flatnonzero(state.assignment != state.assignment[item_a])
+        if len(candidates) == 0:
+            break
+        state.apply_swap(item_a, rng.choice(candidates))
+
+
+def _pick(values, rng, candidate_count):
+    # argmax, or a random choice among the candidate_count best finite values (GRASP)
+    if rng is None or candidate_count <= 1:
+        return int(np.argmax(values))
+    count = min(candidate_count, int(np.count_nonzero(np.isfinite(values))))
+    top = np.argpartition(values, -count)[-count:]
+    return int(rng.choice(top))
+
+
+def greedy_construction(N, K, Mk, s, rng=None, candidate_count=1, trace=None):
+    # With an rng and candidate_count > 1 every choice is drawn from the
+    # candidate_count best options (randomized construction for multi-start)
+    # Sort objects by similarity sum in descending order
+    order = np.argsort(-s.sum(axis=1), kind='stable')
+    rank = np.argsort(order)
+    available = np.ones(N, dtype=bool)
+
+    # Initialize empty clusters
+    clusters = [[] for _ in range(K)]
+
+    with phase(trace, 'seed selection'):
+        # Select the most compatible object pairs to start clusters (masked argmax)
+        if isinstance(s, SparseSimilarity):
+            # Only the kNN pairs are candidates; pairs touching a chosen item are masked
+            edge_rows, edge_columns, edge_values = s.edges()
+            pair_values = edge_values.astype(np.float64)
+            for cluster_index in range(K):
+                pair = _pick(pair_values, rng, candidate_count)
+                i, j = int(edge_rows[pair]), int(edge_columns[pair])
+                if rank[i] > rank[j]:
+                    i, j = j, i
+                clusters[cluster_index] += [i, j]
+                available[[i, j]] = False
+                pair_values[~(available[edge_rows] & available[edge_columns])] = -np.inf
+        else:
+            pair_values = upper_triangle(s).astype(np.float64)
+            for cluster_index in range(K):
+                i, j = pair_from_index(N, _pick(pair_values, rng, candidate_count))
+                if rank[i] > rank[j]:
+                    i, j = j, i
+                clusters[cluster_index] += [i, j]
+                available[[i, j]] = False
+                pair_values[item_pair_indices(N, i)] = -np.inf
+                pair_values[item_pair_indices(N, j)] = -np.inf
+
+    with phase(trace, 'greedy fill'):
+        # Add other objects that maximize the objective, keeping a running affinity
+        # of every object to the cluster being built
+        for cluster_index in range(K):
+            affinity = s[:, clusters[cluster_index]].sum(axis=1)
+            while len(clusters[cluster_index]) < Mk[cluster_index] and available.any():
+                candidates = np.where(available[order], affinity[order], -np.inf)
+                best_item = int(order[_pick(candidates, rng, candidate_count)])
+                clusters[cluster_index].append(best_item)
+                available[best_item] = False
+                affinity += s[best_item]
+
+    # Objects left outside the clusters, still in similarity-sum order
+    sorted_items = [int(item) for item in order if available[item]]
+    return clusters, sorted_items
+
+
+class SwapState:
+    # Incremental evaluation of swap moves.
+    # gain[i, k] holds the similarity of item i to the items currently in cluster k,
+    # so any swap gain is O(1) and applying a move costs O(N).
+    def __init__(self, s, clusters, outside_items):
+        self.s = s
+        self.clusters = clusters
+        self.outside_items = outside_items
+        self.assignment = np.full(len(s), -1, dtype=np.int64)  # -1 = not in any cluster
+        self.gain = np.zeros((len(s), len(clusters)))
+        for cluster_index, cluster in enumerate(clusters):
+            self.assignment[cluster] = cluster_index
+            # Column blocks keep the N x Mk slice small for large sparse instances
+            block_size = max(1, MOVE_BLOCK_CELLS // len(s))
+            for start in range(0, len(cluster), block_size):
+                self.gain[:, cluster_index] += s[:, cluster[start:start + block_size]].sum(axis=1)
+        self.objective = compute_objective(clusters, s)
+
+    @classmethod
+    def from_assignment(cls, s, K, assignment):
+        # Rebuild a state from an assignment array (-1 = outside)
+        clusters = [np.flatnonzero(assignment == cluster_index).tolist() for cluster_index in range(K)]
+        return cls(s, clusters, np.flatnonzero(assignment < 0).tolist())
+
+    def insert_gain(self, item, cluster_index):
+        # Objective increase when item joins cluster_index
+        return self.gain[item, cluster_index]
+
+    def swap_gain(self, item_a, item_b):
+        # Objective change when item_a and item_b exchange their cluster (or outside) positions
+        cluster_a = self.assignment[item_a]
+        cluster_b = self.assignment[item_b]
+        if cluster_a == cluster_b:
+            return 0.0
+        delta = 0.0
+        if cluster_a >= 0:
+            delta += self.gain[item_b, cluster_a] - self.s[item_a, item_b] - self.gain[item_a, cluster_a]
+        if cluster_b >= 0:
+            delta += self.gain[item_a, cluster_b] - self.s[item_a, item_b] - self.gain[item_b, cluster_b]
+        return delta
+
+    def apply_swap(self, item_a, item_b):
+        delta = self.swap_gain(item_a, item_b)
+        cluster_a = self.assignment[item_a]
+        cluster_b = self.assignment[item_b]
+        self._replace(cluster_a, item_a, item_b)
+        self._replace(cluster_b, item_b, item_a)
+        self.assignment[item_a] = cluster_b
+        self.assignment[item_b] = cluster_a
+        self.objective += delta
+        return delta
+
+    def _replace(self, cluster_index, old_item, new_item):
+        if cluster_index >= 0:
+            members = self.clusters[cluster_index]
+            self.gain[:, cluster_index] += self.s[:, new_item] - self.s[:, old_item]
+        else:
+            members = self.outside_items
+        members.remove(old_item)
+        members.append(new_item)
+
+    def move_gains(self, rows=None):
+        # Gains of every swap between a clustered item (rows) and any item of another
+        # cluster or outside the clusters (columns), computed as one array
+        if rows is None:
+            rows = np.flatnonzero(self.assignment >= 0)
+        row_clusters = self.assignment[rows]
+        column_clusters = self.assignment
+        inside = column_clusters >= 0
+        safe_clusters = np.where(inside, column_clusters, 0)
+        own = np.where(inside, self.gain[np.arange(len(self.gain)), safe_clusters], 0.0)
+        s_rows = self.s[rows]
+
+        # item_a leaves its cluster, item_b takes its place
+        gains = self.gain[:, row_clusters].T - own[rows][:, None] - s_rows
+        # item_b leaves its cluster (if any), item_a takes its place
+        gains += np.where(inside, self.gain[rows][:, safe_clusters] - own - s_rows, 0.0)
+        gains[row_clusters[:, None] == column_clusters[None, :]] = -np.inf
+        gains[:, column_clusters == REMOVED] = -np.inf
+        return rows, gains
+
+    def best_move(self, first_improvement=False):
+        # Returns (gain, item_a, item_b) of the best (or first improving) swap. The neighbourhood
+        # is scanned in blocks of clustered items so that memory stays O(MOVE_BLOCK_CELLS) for large N
+        clustered = np.flatnonzero(self.assignment >= 0)
+        block_size = max(1, MOVE_BLOCK_CELLS // len(self.assignment))
+        best = (-np.inf, None, None)
+        for start in range(0, len(clustered), block_size):
+            rows, gains = self.move_gains(clustered[start:start + block_size])
+            if first_improvement:
+                improving = np.flatnonzero(gains > IMPROVEMENT_TOLERANCE)
+                index = improving[0] if len(improving) else np.argmax(gains)
+            else:
+                index = np.argmax(gains)
+            row, item_b = np.unravel_index(index, gains.shape)
+            if gains[row, item_b] > best[0]:
+                best = (gains[row, item_b], rows[row], item_b)
+            if first_improvement and best[0] > IMPROVEMENT_TOLERANCE:
+                break
+        return best
+
+
 def compute_objective(clusters, s):
     objective_value = 0
     for cluster in clusters:
-        for i in range(len(cluster)):
-            for j in range(i + 1, len(cluster)):
-                objective_value += s[cluster[i]][cluster[j]]
+        objective_value += s[np.ix_(cluster, cluster)].sum() / 2
     return objective_value
 
 
-def write_output(file_name, instance_name, objective_value, cluster_swaps, outside_swaps, total_swaps, time_to_best, total_time):
+def write_output(file_name, instance_name, objective_value, cluster_swaps, outside_swaps, total_swaps, time_to_best, total_time,
+                 upper_bound=None):
     with open(file_name, 'a') as output_file:
         output_file.write(f"Instance file: {instance_name} ")
         output_file.write(f"Objective value: {objective_value:} ")
@@ -171,6 +457,9 @@ def write_output(file_name, instance_name, objective_value, cluster_swaps, outsi
         output_file.write(f"Total swaps (including between clusters): {total_swaps} ")
         output_file.write(f"Time to best: {time_to_best:} seconds ")
         output_file.write(f"Total execution time: {total_time:} seconds ")
+        if upper_bound is not None:
+            output_file.write(f"Upper bound: {upper_bound} ")
+            output_file.write(f"Gap: {100 * optimality_gap(objective_value, upper_bound):.4f}% ")
         output_file.write("\n")
 
 
@@ -181,15 +470,17 @@ def main():
 
     # Read data from the input file
     N, K, Mk, s = read_input(input_file_name)
+    upper_bound = compute_upper_bound(s, Mk)
 
     # Apply the constructive heuristic with a maximum time of 600 seconds
     clusters, objective_value, cluster_swaps, outside_swaps, total_swaps, time_to_best, total_time = constructive_heuristic(N, K, Mk,
                                                                                                                s,
-                                                                                                               time_limit=600)
+                                                                                                               time_limit=600,
+                                                                                                               upper_bound=upper_bound)
 
     # Write results to the output file
     write_output(output_file_name, input_file_name, objective_value, cluster_swaps, outside_swaps, total_swaps, time_to_best,
-                 total_time)
+                 total_time, upper_bound)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import glob
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bounds import optimality_gap, upper_bound as compute_upper_bound
+from instance_io import read_input
+from instrumentation import Trace, profile, write_phases, write_trace
+from similarity import stream_knn, stream_objective
+
+# Solver name -> script implementing it
+SOLVER_SCRIPTS = {
+    'F1': 'F1 model.py',
+    'F2': 'F2 model.py',
+    'greedy': 'Heuristic model.py',
+    '2o3': 'Heuristic2o3.py',
+    'tabu': 'Heuristic2o3.py',
+    'multistart': 'multistart.py',
+    'compact': 'mip_builder.py',
+}
+# Solvers built on Heuristic2o3, the only ones that accept the SparseSimilarity of --knn
+KNN_SOLVERS = ('2o3', 'tabu', 'multistart')
+
+RESULT_FIELDS = ['instance', 'solver', 'N', 'K', 'Mk', 'objective', 'bound', 'gap', 'optimal', 'swaps',
+                 'time_to_best', 'build_time', 'total_time', 'error']
+
+_scripts = {}
+
+
+def load_script(file_name):
+    # The scripts have spaces in their names, so they are loaded by path (once per process).
+    # The module is registered in sys.modules (or reused from there) so that its functions
+    # pickle by name for spawned processes
+    if file_name not in _scripts:
+        module_name = os.path.splitext(file_name)[0].replace(' ', '_')
+        module = sys.modules.get(module_name)
+        if module is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+        _scripts[file_name] = module
+    return _scripts[file_name]
+
+
+def run_solver(solver, N, K, Mk, s, time_limit, gap_tolerance=0.0, trace=None, seed=None, **mip_options):
+    # Uniform result dict for every solver. The heuristics get the combinatorial upper bound
+    # (computed outside their time) for the gap and stop once it is at most gap_tolerance,
+    # and record their incumbents and phase times in trace (an instrumentation.Trace) if given.
+    # seed: random seed of the stochastic solvers (tabu, multistart)
+    script = load_script(SOLVER_SCRIPTS[solver])
+    heuristic_bound = None if solver in ('F1', 'F2', 'compact') else compute_upper_bound(s, Mk)
+    start_time = time.time()
+    if solver in ('F1', 'F2'):
+        solve = getattr(script, 'solve_' + solver)
+        clusters, objective, is_optimal, bound, _, build_time = solve(N, K, Mk, s, time_limit=time_limit,
+                                                                      **mip_options)
+        result = {'objective': objective, 'bound': bound, 'optimal': is_optimal, 'build_time': build_time}
+    elif solver == 'compact':
+        # Symmetry-free formulation, only valid for K = 1 or groups of equal-size clusters
+        clusters, objective, is_optimal, bound, _, build_time = script.solve_compact(N, K, Mk, s, time_limit)
+        result = {'objective': objective, 'bound': bound, 'optimal': is_optimal, 'build_time': build_time}
+    elif solver == 'greedy':
+        clusters, objective, improving_swaps, time_to_best = script.constructive_heuristic(N, K, Mk, s, time_limit,
+                                                                                           trace=trace)
+        result = {'objective': objective, 'swaps': improving_swaps, 'time_to_best': time_to_best}
+    elif solver == 'multistart':
+        # One worker per job: the batch pool already spreads jobs over the CPUs
+        clusters, objective, iterations, time_to_best, _ = script.multi_start(N, K, Mk, s, time_limit, workers=1,
+                                                                              seed=seed, upper_bound=heuristic_bound,
+                                                                              gap_tolerance=gap_tolerance,
+                                                                              trace=trace)
+        result = {'objective': objective, 'swaps': iterations, 'time_to_best': time_to_best}
+    elif solver == 'tabu':
+        clusters, objective, _, _, total_swaps, time_to_best, _ = script.tabu_search(N, K, Mk, s, time_limit,
+                                                                                     seed=seed,
+                                                                                     upper_bound=heuristic_bound,
+                                                                                     gap_tolerance=gap_tolerance,
+                                                                                     trace=trace)
+        result = {'objective': objective, 'swaps': total_swaps, 'time_to_best': time_to_best}
+    else:
+        clusters, objective, _, _, total_swaps, time_to_best, _ = script.constructive_heuristic(
+            N, K, Mk, s, time_limit, upper_bound=heuristic_bound, gap_tolerance=gap_tolerance, trace=trace)
+        result = {'objective': objective, 'swaps': total_swaps, 'time_to_best': time_to_best}
+    if heuristic_bound is not None:
+        result['bound'] = heuristic_bound
+    result['gap'] = optimality_gap(result['objective'], result.get('bound'))
+    result['total_time'] = time.time() - start_time
+    result['clusters'] = clusters
+    return result
+
+
+def run_job(job):
+    # knn: stream the instance into a kNN graph with this many neighbours per item instead of
+    # loading the dense matrix; the reported objective is re-evaluated on the full triangle.
+    # instrument: {'trace': True} adds the run's Trace as row['trace'];
+    # {'profile_dir': directory, 'profiler': 'cprofile' or 'pyinstrument'} profiles the solver
+    instance, solver, time_limit, mip_options, knn, instrument = job
+    row = {'instance': os.path.basename(instance), 'solver': solver}
+    try:
+        N, K, Mk, s = stream_knn(instance, knn) if knn else read_input(instance)
+        row.update(N=N, K=K, Mk=' '.join(map(str, Mk)))
+        trace = Trace() if instrument.get('trace') else None
+        if instrument.get('profile_dir'):
+            profile_file_name = os.path.join(instrument['profile_dir'], f"{row['instance']}_{solver}.prof")
+            result, _ = profile(run_solver, solver, N, K, Mk, s, time_limit, trace=trace,
+                                profiler=instrument.get('profiler', 'cprofile'),
+                                output_file_name=profile_file_name, **mip_options)
+        else:
+            result = run_solver(solver, N, K, Mk, s, time_limit, trace=trace, **mip_options)
+        if trace is not None:
+            row['trace'] = trace
+        clusters = result.pop('clusters')
+        if knn:
+            result['objective'] = stream_objective(instance, clusters)
+            result['gap'] = optimality_gap(result['objective'], result.get('bound'))
+        row.update(result)
+    except Exception as error:  # keep the batch going, the failure is recorded in the table
+        row['error'] = f"{type(error).__name__}: {error}"
+    return row
+
+
+def _pin_worker(cpu_queue):
+    # Pin each worker process to its own CPU (Linux only)
+    cpu = cpu_queue.get()
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {cpu})
+
+
+def run_batch(instances, solvers, time_limit=600, workers=None, pin_cpus=True, mip_options=None, knn=None,
+              instrument=None):
+    # mip_options: keyword arguments for the F1/F2 solvers (symmetry_breaking, warm_start, lazy_linking, ...)
+    # and gap_tolerance and seed for the heuristics; instrument: see run_job
+    jobs = [(instance, solver, time_limit, mip_options or {}, knn, instrument or {})
+            for instance in instances for solver in solvers]
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    workers = workers or len(cpus)
+
+    # One CPU id per worker; None disables pinning
+    cpu_queue = multiprocessing.Queue()
+    for worker in range(workers):
+        cpu_queue.put(cpus[worker % len(cpus)] if pin_cpus else None)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_pin_worker, initargs=(cpu_queue,)) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            rows.append(future.result())
+    rows.sort(key=lambda row: (row['instance'], solvers.index(row['solver'])))
+    return rows
+
+
+def write_results(file_name, rows):
+    with open(file_name, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Run solvers over a set of k-cluster instances in parallel")
+    parser.add_argument('instances', nargs='+', help="instance files or glob patterns, e.g. 'kcluster40_*.txt'")
+    parser.add_argument('--solvers', nargs='+', default=['greedy', '2o3'], choices=sorted(SOLVER_SCRIPTS))
+    parser.add_argument('--time-limit', type=float, default=600, help="time limit per job in seconds")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--no-pin', action='store_true', help="do not pin workers to CPUs")
+    parser.add_argument('--symmetry-breaking', action='store_true', help="F1/F2: order equal-size clusters")
+    parser.add_argument('--warm-start', action='store_true', help="F1/F2: start from the Heuristic2o3 solution")
+    parser.add_argument('--lazy-linking', action='store_true', help="F1/F2: separate pair-linking rows lazily")
+    parser.add_argument('--cardinality-cuts', action='store_true', help="F1: add sum_j y_ijk <= (Mk - 1) x_ik")
+    parser.add_argument('--triangle-cuts', action='store_true', help="F1: separate triangle inequalities")
+    parser.add_argument('--gap', type=float, default=0.0,
+                        help="heuristics: stop once the relative gap to the upper bound is at most this")
+    parser.add_argument('--knn', type=int, default=None,
+                        help=f"{', '.join(KNN_SOLVERS)} only: stream each instance into a kNN graph with this many "
+                             "neighbours per item")
+    parser.add_argument('--trace', default=None,
+                        help="heuristics: write the incumbent trace to this CSV (phase times to *_phases.csv)")
+    parser.add_argument('--profile', default=None, help="write a profile of every job to this directory")
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile')
+    parser.add_argument('--output', default='batch_results.csv')
+    args = parser.parse_args()
+    if args.knn is not None and not set(args.solvers) <= set(KNN_SOLVERS):
+        parser.error(f"--knn only works with the solvers {', '.join(KNN_SOLVERS)}, not "
+                     f"{', '.join(solver for solver in args.solvers if solver not in KNN_SOLVERS)}")
+
+    instances = sorted({file_name for pattern in args.instances for file_name in glob.glob(pattern)})
+    start_time = time.time()
+    mip_options = {'symmetry_breaking': args.symmetry_breaking, 'warm_start': args.warm_start,
+                   'lazy_linking': args.lazy_linking, 'cardinality_cuts': args.cardinality_cuts,
+                   'triangle_cuts': args.triangle_cuts, 'gap_tolerance': args.gap}
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+    instrument = {'trace': args.trace is not None, 'profile_dir': args.profile, 'profiler': args.profiler}
+    rows = run_batch(instances, args.solvers, args.time_limit, args.workers, pin_cpus=not args.no_pin,
+                     mip_options=mip_options, knn=args.knn, instrument=instrument)
+    write_results(args.output, rows)
+    if args.trace:
+        traces = [(row['solver'], row['instance'], row['trace']) for row in rows if 'trace' in row]
+        write_trace(args.trace, traces)
+        write_phases(os.path.splitext(args.trace)[0] + '_phases.csv', traces)
+    print(f"{len(rows)} runs written to {args.output} in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
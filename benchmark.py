@@ -0,0 +1,244 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_runner import RESULT_FIELDS, SOLVER_SCRIPTS, run_job
+
+BENCHMARK_FIELDS = RESULT_FIELDS[:-1] + ['best_known', 'gap_to_best_known', 'peak_rss_mb', 'error']
+REFERENCE_LOGS = ['ResultF1.txt', 'ResultF2.txt']
+
+# Log label -> result field, for the lines written by the solvers' write_output
+LOG_LABELS = {
+    'Solution': 'objective',
+    'Objective value': 'objective',
+    'Best bound': 'bound',
+    'Upper bound': 'bound',
+    'Solution time': 'total_time',
+    'Total execution time': 'total_time',
+    'Time to best': 'time_to_best',
+    'Build time': 'build_time',
+    'Improving swaps': 'swaps',
+    'Total swaps (including between clusters)': 'swaps',
+}
+LOG_PATTERN = re.compile(r"(" + "|".join(re.escape(label) for label in sorted(LOG_LABELS, key=len, reverse=True)) +
+                         r"): (\S+)")
+
+# Regression tolerances: objective below baseline - QUALITY_TOLERANCE, or total time above
+# baseline * (1 + TIME_TOLERANCE) + TIME_SLACK seconds
+QUALITY_TOLERANCE = 1e-6
+TIME_TOLERANCE = 0.25
+TIME_SLACK = 0.05
+# Solvers gated on the exact objective: deterministic, and the heuristics stop at a local optimum well
+# inside the time limit. The others (tabu, multistart, and the MIPs stopped by the time limit) depend on
+# how far they get before the deadline, so they are gated on gap_to_best_known growing by more than
+# GAP_TOLERANCE (or, without a best known value, on a relative objective drop of that size)
+EXACT_SOLVERS = {'greedy', '2o3'}
+GAP_TOLERANCE = 0.01
+# Seed of the stochastic solvers, fixed so that runs are comparable
+BENCHMARK_SEED = 0
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_result_log(file_name):
+    # One dict per "Instance file: ..." line of a result log
+    rows = []
+    with open(file_name) as log_file:
+        for line in log_file:
+            instance = re.search(r"Instance file: (\S+)", line)
+            if not instance:
+                continue
+            row = {'instance': os.path.basename(instance.group(1)), 'optimal': '(Optimal)' in line}
+            for label, value in LOG_PATTERN.findall(line):
+                row.setdefault(LOG_LABELS[label], _number(value))
+            rows.append(row)
+    return rows
+
+
+def reference_values(log_files=REFERENCE_LOGS):
+    # Best known objective, best bound and proven optimality per instance over all logs;
+    # lines repeated by several runs collapse to a single entry
+    references = {}
+    for file_name in log_files:
+        if not os.path.exists(file_name):
+            continue
+        for row in parse_result_log(file_name):
+            reference = references.setdefault(row['instance'], {'best_known': None, 'bound': None, 'optimal': False})
+            if row.get('objective') is not None and (reference['best_known'] is None or
+                                                     row['objective'] > reference['best_known']):
+                reference['best_known'] = row['objective']
+            if row.get('bound') is not None and (reference['bound'] is None or row['bound'] < reference['bound']):
+                reference['bound'] = row['bound']
+            reference['optimal'] |= row['optimal']
+    return references
+
+
+def _benchmark_job(job):
+    # Runs in a fresh process (max_tasks_per_child=1), so ru_maxrss is the peak of this job alone;
+    # RUSAGE_CHILDREN covers the worker processes of multistart
+    row = run_job(job)
+    scale = 1024 if sys.platform != 'darwin' else 1024 * 1024  # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    row['peak_rss_mb'] = peak_rss / scale
+    return row
+
+
+def run_benchmark(instances, solvers, time_limit=60, workers=None, mip_options=None, references=None,
+                  seed=BENCHMARK_SEED):
+    options = {'seed': seed, **(mip_options or {})}
+    jobs = [(instance, solver, time_limit, options, None, {}) for instance in instances for solver in solvers]
+    # Non-daemonic workers (unlike multiprocessing.Pool), so multistart can start its own processes
+    with ProcessPoolExecutor(workers or os.cpu_count(), max_tasks_per_child=1) as executor:
+        rows = list(executor.map(_benchmark_job, jobs))
+
+    for row in rows:
+        reference = (references or {}).get(row['instance'])
+        if reference and reference['best_known'] is not None and row.get('objective') is not None:
+            row['best_known'] = reference['best_known']
+            row['gap_to_best_known'] = max(0.0, (reference['best_known'] - row['objective']) / abs(reference['best_known']))
+    return rows
+
+
+def family_instances(families, directory='.'):
+    # '1_10' -> kcluster40_1_10v*.txt; anything with a wildcard or extension is used as a glob
+    patterns = [family if any(c in family for c in '*?.') else os.path.join(directory, f"kcluster40_{family}v*.txt")
+                for family in families]
+    return sorted({file_name for pattern in patterns for file_name in glob.glob(pattern)})
+
+
+def summarize(rows):
+    # Per solver: runs, errors, instances matching the best known value, mean gap and times
+    summary = {}
+    for row in rows:
+        entry = summary.setdefault(row['solver'], {'runs': 0, 'errors': 0, 'best_known_matched': 0,
+                                                   'mean_gap_to_best_known': 0.0, 'mean_total_time': 0.0,
+                                                   'max_peak_rss_mb': 0.0})
+        entry['runs'] += 1
+        if row.get('error'):
+            entry['errors'] += 1
+            continue
+        gap = row.get('gap_to_best_known')
+        if gap is not None:
+            entry['best_known_matched'] += gap <= QUALITY_TOLERANCE
+            entry['mean_gap_to_best_known'] += gap
+        entry['mean_total_time'] += row.get('total_time') or 0.0
+        entry['max_peak_rss_mb'] = max(entry['max_peak_rss_mb'], row.get('peak_rss_mb') or 0.0)
+    for entry in summary.values():
+        completed = max(1, entry['runs'] - entry['errors'])
+        entry['mean_gap_to_best_known'] /= completed
+        entry['mean_total_time'] /= completed
+    return summary
+
+
+def _quality_regressed(row, old, gap_tolerance):
+    # Exact objective for EXACT_SOLVERS, gap to the best known value (or relative drop) for the others
+    if row.get('objective') is None:
+        return True
+    if row['solver'] in EXACT_SOLVERS:
+        return row['objective'] < old['objective'] - QUALITY_TOLERANCE
+    if row.get('gap_to_best_known') is not None and old.get('gap_to_best_known') is not None:
+        return row['gap_to_best_known'] > old['gap_to_best_known'] + gap_tolerance
+    return old['objective'] - row['objective'] > gap_tolerance * abs(old['objective'])
+
+
+def compare_with_baseline(rows, baseline_rows, time_tolerance=TIME_TOLERANCE, check_time=True,
+                          gap_tolerance=GAP_TOLERANCE):
+    # List of regressions (instance, solver, what, baseline value, new value)
+    baseline = {(row['instance'], row['solver']): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        old = baseline.get((row['instance'], row['solver']))
+        if old is None:
+            continue
+        if row.get('error') and not old.get('error'):
+            regressions.append((row['instance'], row['solver'], 'error', None, row['error']))
+            continue
+        if old.get('objective') is not None and _quality_regressed(row, old, gap_tolerance):
+            regressions.append((row['instance'], row['solver'], 'objective', old['objective'], row.get('objective')))
+        if check_time and old.get('total_time') is not None and row.get('total_time') is not None and \
+                row['total_time'] > old['total_time'] * (1 + time_tolerance) + TIME_SLACK:
+            regressions.append((row['instance'], row['solver'], 'total_time', old['total_time'], row['total_time']))
+    return regressions
+
+
+def write_csv(file_name, rows):
+    with open(file_name, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=BENCHMARK_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_json(file_name, rows, summary, regressions=()):
+    with open(file_name, 'w') as output_file:
+        json.dump({'rows': rows, 'summary': summary,
+                   'regressions': [dict(zip(('instance', 'solver', 'metric', 'baseline', 'value'), regression))
+                                   for regression in regressions]}, output_file, indent=1, default=str)
+
+
+def read_baseline(file_name):
+    with open(file_name) as baseline_file:
+        return json.load(baseline_file)['rows']
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark solvers on k-cluster instance families and check for "
+                                                 "regressions against a stored baseline")
+    parser.add_argument('families', nargs='+', help="families such as 1_10 or 3_7_7_6, or instance globs")
+    parser.add_argument('--solvers', nargs='+', default=['2o3', 'tabu', 'multistart'], choices=sorted(SOLVER_SCRIPTS))
+    parser.add_argument('--time-limit', type=float, default=60)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--logs', nargs='*', default=REFERENCE_LOGS, help="result logs with known optima")
+    parser.add_argument('--baseline', default=None, help="JSON written by an earlier run to compare against")
+    parser.add_argument('--save-baseline', default=None, help="also write this run as a baseline JSON")
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE,
+                        help="allowed relative slowdown against the baseline")
+    parser.add_argument('--gap-tolerance', type=float, default=GAP_TOLERANCE,
+                        help="allowed growth of the gap to the best known value for the solvers not in "
+                             f"{sorted(EXACT_SOLVERS)}, which are compared on exact objective values")
+    parser.add_argument('--seed', type=int, default=BENCHMARK_SEED, help="seed of the tabu and multistart solvers")
+    parser.add_argument('--no-time-check', action='store_true', help="compare objective values only")
+    parser.add_argument('--output', default='benchmark_results', help="prefix of the .csv and .json outputs")
+    args = parser.parse_args()
+
+    instances = family_instances(args.families)
+    start_time = time.time()
+    rows = run_benchmark(instances, args.solvers, args.time_limit, args.workers, references=reference_values(args.logs),
+                         seed=args.seed)
+    summary = summarize(rows)
+    regressions = []
+    if args.baseline:
+        regressions = compare_with_baseline(rows, read_baseline(args.baseline), args.time_tolerance,
+                                            check_time=not args.no_time_check, gap_tolerance=args.gap_tolerance)
+
+    write_csv(args.output + '.csv', rows)
+    write_json(args.output + '.json', rows, summary, regressions)
+    if args.save_baseline:
+        write_json(args.save_baseline, rows, summary)
+
+    for solver, entry in summary.items():
+        print(f"{solver}: {entry['best_known_matched']}/{entry['runs']} best known, mean gap "
+              f"{100 * entry['mean_gap_to_best_known']:.3f}%, mean time {entry['mean_total_time']:.2f} s, "
+              f"peak RSS {entry['max_peak_rss_mb']:.0f} MB, {entry['errors']} errors")
+    for instance, solver, metric, old, new in regressions:
+        print(f"REGRESSION {instance} {solver} {metric}: baseline {old}, now {new}")
+    print(f"{len(rows)} runs in {time.time() - start_time:.2f} seconds")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
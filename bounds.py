@@ -0,0 +1,77 @@
+import numpy as np
+
+from similarity import SparseSimilarity
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional, the bound falls back to the per-cluster relaxation
+    linear_sum_assignment = None
+
+# Rows of s processed at once by the top-similarity bound
+ROW_BLOCK = 1024
+# Largest N for the dense eigenvalue bound (O(N^3) time, N^2 memory)
+EIGENVALUE_MAX_N = 4000
+# Largest N * sum(Mk) cost matrix for the exact assignment step
+ASSIGNMENT_MAX_CELLS = 10 ** 7
+
+
+def top_similarity_sums(s, max_count):
+    # top[i, m] = sum of the m largest similarities of item i to the other items, m = 0..max_count
+    N = len(s)
+    max_count = min(max_count, N - 1)
+    top = np.zeros((N, max_count + 1))
+    for start in range(0, N, ROW_BLOCK):
+        rows = np.arange(start, min(start + ROW_BLOCK, N))
+        block = np.array(s[rows], dtype=np.float64)
+        block[np.arange(len(rows)), rows] = -np.inf  # the diagonal is not a pair
+        if max_count < N - 1:
+            block = np.partition(block, N - 1 - max_count, axis=1)[:, N - 1 - max_count:]
+        block = -np.sort(-block, axis=1)[:, :max_count]
+        top[rows, 1:] = np.cumsum(block, axis=1)
+    return top
+
+
+def top_similarity_bound(s, Mk):
+    # An item of a cluster of size m contributes at most half the sum of its m - 1 largest
+    # similarities; the best assignment of items to cluster slots bounds the objective
+    N = len(s)
+    top = top_similarity_sums(s, max(Mk) - 1)
+    weights = top[:, [min(m - 1, N - 1) for m in Mk]] / 2  # N x K
+    if linear_sum_assignment is not None and N * sum(Mk) <= ASSIGNMENT_MAX_CELLS:
+        slots = np.repeat(np.arange(len(Mk)), Mk)
+        rows, columns = linear_sum_assignment(weights[:, slots], maximize=True)
+        return float(weights[rows, slots[columns]].sum())
+    # Relaxation without disjoint clusters: each cluster takes its Mk best items
+    return float(sum(np.sort(weights[:, k])[len(weights) - m:].sum() for k, m in enumerate(Mk)))
+
+
+def eigenvalue_bound(s, Mk):
+    # sum_k x_k' S x_k / 2 <= lambda_max(S) * sum(Mk) / 2 for 0/1 vectors x_k with |x_k| = Mk
+    dense = s.to_dense() if hasattr(s, 'to_dense') else np.asarray(s)
+    return float(np.linalg.eigvalsh(dense.astype(np.float64))[-1]) * sum(Mk) / 2
+
+
+def upper_bound(s, Mk):
+    # Best of the available certified bounds on the optimal objective value
+    if isinstance(s, SparseSimilarity):
+        # A kNN graph keeps each item's k largest similarities exactly, which is all the
+        # top-similarity bound reads when k >= Mk - 1; other bounds would not hold for the full s
+        return top_similarity_bound(s, Mk) if s.k is not None and max(Mk) - 1 <= s.k else None
+    bound = top_similarity_bound(s, Mk)
+    if len(s) <= EIGENVALUE_MAX_N:
+        bound = min(bound, eigenvalue_bound(s, Mk))
+    return bound
+
+
+def optimality_gap(objective_value, bound):
+    # Relative gap (bound - objective) / |bound|, as reported by the MIP solvers
+    if objective_value is None or bound is None:
+        return None
+    if bound == 0:
+        return 0.0 if objective_value >= 0 else float('inf')
+    return max(0.0, (bound - objective_value) / abs(bound))
+
+
+def gap_closed(objective_value, bound, gap_tolerance):
+    # Early stopping test for the heuristics
+    return bound is not None and optimality_gap(objective_value, bound) <= gap_tolerance
@@ -0,0 +1,172 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from instance_io import BINARY_EXTENSION, write_binary_header
+
+# Cells of the similarity block computed by one task
+GENERATOR_BLOCK_CELLS = 1 << 22
+METRICS = ('cosine', 'rbf', 'random')
+
+_features = None
+
+
+def _set_features(features):
+    # Worker initializer: the feature array is sent once per process, not once per block
+    global _features
+    _features = features
+
+
+def row_blocks(N, block_cells=GENERATOR_BLOCK_CELLS):
+    # Consecutive row ranges whose upper-triangle rows hold about block_cells values
+    block_rows = max(1, block_cells // max(N, 1))
+    return [(first_row, min(first_row + block_rows, N)) for first_row in range(0, N, block_rows)]
+
+
+def _upper_rows(block, first_row, last_row, N):
+    # Packed s[i, i+1:] for first_row <= i < last_row from a (rows, N - first_row) block
+    # whose column c is item first_row + c
+    rows, columns = np.triu_indices(last_row - first_row, 1, N - first_row)
+    return block[rows, columns]
+
+
+def similarity_block(first_row, last_row, metric='cosine', gamma=None, seed=0, N=None):
+    # Packed triangle rows first_row..last_row-1. 'cosine' and 'rbf' read the features set by
+    # _set_features; 'random' reproduces Matrix sij.py ((u + u') / 2 with u, u' uniform) with a
+    # generator seeded by (seed, first_row), so the output does not depend on the worker count
+    if metric == 'random':
+        rng = np.random.default_rng([seed, first_row])
+        lengths = N - 1 - np.arange(first_row, last_row)
+        return (rng.random(lengths.sum()) + rng.random(lengths.sum())) / 2
+
+    features = _features
+    N = len(features)
+    block = features[first_row:last_row] @ features[first_row:].T
+    if metric == 'rbf':
+        norms = (features[first_row:] ** 2).sum(axis=1)
+        block = np.exp(-gamma * np.maximum(norms[:last_row - first_row, None] + norms[None, :] - 2 * block, 0))
+    return _upper_rows(block, first_row, last_row, N)
+
+
+def similarity_blocks(N, metric='cosine', features=None, gamma=None, seed=0, workers=1,
+                      block_cells=GENERATOR_BLOCK_CELLS):
+    # Yields (first_row, last_row, values) in row order, the layout of instance_io.iter_triangle_blocks.
+    # With several workers the blocks are computed in parallel, at most 2 * workers ahead of the writer.
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r}, expected one of {METRICS}")
+    if metric != 'random':
+        features = np.asarray(features, dtype=np.float64)
+        N = len(features)
+        if metric == 'cosine':
+            norms = np.linalg.norm(features, axis=1, keepdims=True)
+            features = features / np.where(norms > 0, norms, 1)
+        elif gamma is None:
+            gamma = 1.0 / features.shape[1]
+    blocks = row_blocks(N, block_cells)
+
+    if workers <= 1:
+        _set_features(features)
+        for first_row, last_row in blocks:
+            yield first_row, last_row, similarity_block(first_row, last_row, metric, gamma, seed, N)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_features, initargs=(features,)) as executor:
+        pending = deque()
+        for first_row, last_row in blocks:
+            pending.append((first_row, last_row,
+                            executor.submit(similarity_block, first_row, last_row, metric, gamma, seed, N)))
+            if len(pending) > 2 * workers:
+                first, last, future = pending.popleft()
+                yield first, last, future.result()
+        for first, last, future in pending:
+            yield first, last, future.result()
+
+
+def write_instance(file_name, N, K, Mk, blocks, dtype=np.float64):
+    # Writes an instance block by block, text or binary according to the file extension;
+    # text rows are formatted one at a time, never the whole file as one string.
+    # Like the original generator the last text line (s[N-1, N:]) is empty.
+    if file_name.endswith(BINARY_EXTENSION):
+        dtype = np.dtype(dtype).newbyteorder('<')
+        with open(file_name, 'wb') as file:
+            write_binary_header(file, N, K, Mk, dtype)
+            for _, _, values in blocks:
+                file.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        return file_name
+
+    with open(file_name, 'w') as file:
+        file.write(f"{N} {K} {' '.join(map(str, Mk))}\n")
+        for first_row, last_row, values in blocks:
+            start = 0
+            for i in range(first_row, last_row):
+                file.write(" ".join(map(str, values[start:start + N - 1 - i].tolist())) + "\n")
+                start += N - 1 - i
+    return file_name
+
+
+def blob_features(N, d, centers, rng, spread=0.5):
+    # Gaussian blobs: a benchmark family with cluster structure for the cosine/RBF metrics
+    means = rng.normal(size=(centers, d))
+    return means[rng.integers(centers, size=N)] + spread * rng.normal(size=(N, d))
+
+
+def instance_name(N, Mk, version, extension='.txt'):
+    # kcluster40_3_10_10_10v15.txt naming of the repository instances
+    return f"kcluster{N}_{len(Mk)}_{'_'.join(map(str, Mk))}v{version}{extension}"
+
+
+def generate_family(N, Mk, count=1, metric='random', d=16, centers=None, gamma=None, seed=0, workers=1,
+                    binary=False, dtype=np.float64, output_dir='.'):
+    # count reproducible instances of size N with clusters Mk; instance v uses seed (seed, v)
+    file_names = []
+    for version in range(1, count + 1):
+        instance_seed = np.random.SeedSequence([seed, version]).generate_state(1)[0]
+        features = None
+        if metric != 'random':
+            rng = np.random.default_rng(instance_seed)
+            features = blob_features(N, d, centers or max(len(Mk), 2), rng)
+        file_name = os.path.join(output_dir, instance_name(N, Mk, version, BINARY_EXTENSION if binary else '.txt'))
+        blocks = similarity_blocks(N, metric, features, gamma, int(instance_seed), workers)
+        file_names.append(write_instance(file_name, N, len(Mk), Mk, blocks, dtype))
+    return file_names
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Generate k-cluster instances from feature vectors or at random")
+    parser.add_argument('--mk', type=int, nargs='+', required=True, help="cluster sizes")
+    parser.add_argument('--n', type=int, default=None, help="number of items (generated families)")
+    parser.add_argument('--features', default=None, help=".npy (N, d) feature array to ingest")
+    parser.add_argument('--metric', choices=METRICS, default='random')
+    parser.add_argument('--gamma', type=float, default=None, help="RBF width, default 1 / d")
+    parser.add_argument('--dimensions', type=int, default=16, help="feature dimension of generated blobs")
+    parser.add_argument('--count', type=int, default=1, help="instances per family")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--binary', action='store_true', help="write the binary format instead of text")
+    parser.add_argument('--float32', action='store_true', help="binary format with float32 similarities")
+    parser.add_argument('--output', default='.', help="output file (--features) or directory (families)")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.features:
+        features = np.load(args.features)
+        metric = 'cosine' if args.metric == 'random' else args.metric
+        blocks = similarity_blocks(len(features), metric, features, args.gamma, args.seed, args.workers)
+        file_names = [write_instance(args.output, len(features), len(args.mk), args.mk, blocks,
+                                     np.float32 if args.float32 else np.float64)]
+    else:
+        file_names = generate_family(args.n, args.mk, args.count, args.metric, args.dimensions, gamma=args.gamma,
+                                     seed=args.seed, workers=args.workers, binary=args.binary,
+                                     dtype=np.float32 if args.float32 else np.float64, output_dir=args.output)
+    for file_name in file_names:
+        print(file_name)
+    print(f"{len(file_names)} instances written in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
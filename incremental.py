@@ -0,0 +1,198 @@
+import time
+
+import numpy as np
+
+from Heuristic2o3 import IMPROVEMENT_TOLERANCE, REMOVED, SwapState, constructive_heuristic, local_search
+
+# Improving moves allowed per repair before giving up on the restricted search
+REPAIR_MOVES = 1000
+
+
+class IncrementalSolver:
+    # Long-lived solution that follows small changes of the instance: items arriving or leaving
+    # and cluster sizes changing. It keeps the SwapState (assignment and gain table) of the current
+    # solution; each update repairs feasibility greedily and then runs a local search restricted
+    # to the swaps touching the affected items, growing that set with every item moved.
+    # Items are identified by ids: 0..N-1 for the initial matrix, N, N+1, ... for added items.
+    # Internally removed items stay in the matrix, marked REMOVED, until compaction.
+    def __init__(self, s, Mk, clusters=None, time_limit=60):
+        s = np.array(s, dtype=np.float64)
+        N = len(s)
+        self.Mk = list(Mk)
+        if sum(self.Mk) > N:
+            raise ValueError(f"cluster sizes {self.Mk} need {sum(self.Mk)} items, only {N} given")
+        if clusters is None:
+            clusters = constructive_heuristic(N, len(self.Mk), self.Mk, s, time_limit)[0]
+        clusters = [list(cluster) for cluster in clusters]
+        clustered = {item for cluster in clusters for item in cluster}
+        self.ids = list(range(N))  # internal index -> id
+        self.index = {item: item for item in range(N)}  # id -> internal index
+        self.next_id = N
+        self._capacity = N
+        self._s = s
+        self.state = SwapState(s, clusters, [item for item in range(N) if item not in clustered])
+
+    # Current solution
+
+    @property
+    def objective(self):
+        return self.state.objective
+
+    @property
+    def clusters(self):
+        return [[self.ids[item] for item in cluster] for cluster in self.state.clusters]
+
+    @property
+    def items(self):
+        # ids of the items currently in the instance, in internal order (the order add_item expects)
+        return [self.ids[item] for item in np.flatnonzero(self.state.assignment != REMOVED)]
+
+    # Updates
+
+    def add_item(self, similarities):
+        # New item with its similarities to self.items (same order); returns its id
+        active = np.flatnonzero(self.state.assignment != REMOVED)
+        similarities = np.asarray(similarities, dtype=np.float64)
+        if len(similarities) != len(active):
+            raise ValueError(f"expected {len(active)} similarities, got {len(similarities)}")
+        N = len(self.state.s)
+        if N == self._capacity:
+            self._grow(max(2 * self._capacity, 16))
+        self._s[N, :N] = 0
+        self._s[N, active] = similarities
+        self._s[:N, N] = self._s[N, :N]
+        self._s[N, N] = 0
+        self._set_size(N + 1)
+
+        state = self.state
+        state.assignment[N] = -1
+        state.gain[N] = [self._s[N, cluster].sum() for cluster in state.clusters]
+        state.outside_items.append(N)
+        item_id = self.next_id
+        self.next_id += 1
+        self.ids.append(item_id)
+        self.index[item_id] = N
+        self._repair_search([N])
+        return item_id
+
+    def remove_item(self, item_id):
+        # Deletes an item; a cluster it leaves is refilled with the best outside item
+        item = self.index.pop(item_id)
+        state = self.state
+        if int(np.count_nonzero(state.assignment != REMOVED)) - 1 < sum(self.Mk):
+            self.index[item_id] = item
+            raise ValueError(f"removing item {item_id} leaves fewer items than the clusters need")
+        cluster_index = state.assignment[item]
+        affected = []
+        if cluster_index >= 0:
+            state.clusters[cluster_index].remove(item)
+            state.gain[:, cluster_index] -= state.s[:, item]
+            state.objective -= state.gain[item, cluster_index]
+        else:
+            state.outside_items.remove(item)
+        state.assignment[item] = REMOVED
+        if cluster_index >= 0:
+            affected = self._fill(cluster_index) + state.clusters[cluster_index]
+        self._repair_search(affected)
+        if np.count_nonzero(state.assignment == REMOVED) > len(state.assignment) // 2:
+            self._compact()
+
+    def resize_cluster(self, cluster_index, size):
+        # Changes Mk of one cluster: greedy insertions of the best outside items, or removal of
+        # the members contributing least, then the restricted local search
+        state = self.state
+        if sum(self.Mk) - self.Mk[cluster_index] + size > int(np.count_nonzero(state.assignment != REMOVED)):
+            raise ValueError(f"not enough items for cluster {cluster_index} of size {size}")
+        self.Mk[cluster_index] = size
+        affected = self._fill(cluster_index)
+        cluster = state.clusters[cluster_index]
+        while len(cluster) > size:
+            item = min(cluster, key=lambda member: state.gain[member, cluster_index])
+            cluster.remove(item)
+            state.gain[:, cluster_index] -= state.s[:, item]
+            state.objective -= state.gain[item, cluster_index]
+            state.assignment[item] = -1
+            state.outside_items.append(item)
+            affected.append(item)
+        self._repair_search(affected + cluster)
+
+    def full_search(self, time_limit=60):
+        # Unrestricted local search over the whole swap neighbourhood
+        return local_search(self.state, time.time() + time_limit)
+
+    # Internals
+
+    def _fill(self, cluster_index):
+        # Insert the best outside items until the cluster has its size; returns them
+        state = self.state
+        added = []
+        while len(state.clusters[cluster_index]) < self.Mk[cluster_index]:
+            outside = np.flatnonzero(state.assignment == -1)
+            item = int(outside[np.argmax(state.gain[outside, cluster_index])])
+            state.objective += state.gain[item, cluster_index]
+            state.gain[:, cluster_index] += state.s[:, item]
+            state.clusters[cluster_index].append(item)
+            state.outside_items.remove(item)
+            state.assignment[item] = cluster_index
+            added.append(item)
+        return added
+
+    def _repair_search(self, affected, max_moves=REPAIR_MOVES):
+        # Best-improvement swaps restricted to moves with an affected item on either side
+        state = self.state
+        affected = set(int(item) for item in affected)
+        for _ in range(max_moves):
+            candidates = np.array(sorted(affected), dtype=np.int64)
+            best = (IMPROVEMENT_TOLERANCE, None, None)
+
+            # Affected clustered items against every other item
+            rows = candidates[state.assignment[candidates] >= 0]
+            if len(rows):
+                rows, gains = state.move_gains(rows)
+                row, column = np.unravel_index(np.argmax(gains), gains.shape)
+                if gains[row, column] > best[0]:
+                    best = (gains[row, column], rows[row], column)
+
+            # Affected outside items against every clustered item: only the leaving item's side changes
+            clustered = np.flatnonzero(state.assignment >= 0)
+            clustered_clusters = state.assignment[clustered]
+            for item in candidates[state.assignment[candidates] == -1]:
+                gains = state.gain[item, clustered_clusters] - state.gain[clustered, clustered_clusters] - \
+                    state.s[item, clustered]
+                index = int(np.argmax(gains))
+                if gains[index] > best[0]:
+                    best = (gains[index], clustered[index], item)
+
+            if best[1] is None:
+                break
+            state.apply_swap(int(best[1]), int(best[2]))
+            affected.update((int(best[1]), int(best[2])))
+
+    def _grow(self, capacity):
+        # Amortized growth of the similarity buffer and of the per-item arrays
+        N = len(self.state.s)
+        buffer = np.zeros((capacity, capacity))
+        buffer[:N, :N] = self.state.s
+        self._s = buffer
+        self._capacity = capacity
+
+    def _set_size(self, N):
+        state = self.state
+        state.s = self._s[:N, :N]
+        old = len(state.assignment)
+        state.assignment = np.concatenate((state.assignment, np.full(N - old, -1, dtype=np.int64)))
+        state.gain = np.concatenate((state.gain, np.zeros((N - old, state.gain.shape[1]))))
+
+    def _compact(self):
+        # Drop removed items from the matrix once they are the majority
+        state = self.state
+        keep = np.flatnonzero(state.assignment != REMOVED)
+        new_index = {int(item): position for position, item in enumerate(keep)}
+        s = state.s[np.ix_(keep, keep)].copy()
+        clusters = [[new_index[item] for item in cluster] for cluster in state.clusters]
+        outside = [new_index[item] for item in state.outside_items]
+        self.ids = [self.ids[item] for item in keep]
+        self.index = {item_id: position for position, item_id in enumerate(self.ids)}
+        self._s = s
+        self._capacity = len(s)
+        self.state = SwapState(s, clusters, outside)
@@ -0,0 +1,172 @@
+import sys
+import numpy as np
+
+# Binary instance layout (little endian, every field 8-byte aligned):
+#   magic b'KCLU' | version uint32 | itemsize uint32 | reserved uint32
+#   N int64 | K int64 | Mk int64 * K
+#   packed upper triangle s[0,1], s[0,2], ..., s[N-2,N-1] as float32/float64
+BINARY_MAGIC = b'KCLU'
+BINARY_VERSION = 1
+BINARY_EXTENSION = '.bin'
+# Similarities held in memory at once when streaming an instance
+STREAM_BLOCK_VALUES = 1 << 22
+
+
+def read_text_instance(file_name):
+    # Reading the input file; the triangle is parsed in one vectorized call
+    with open(file_name, 'r') as file:
+        first_line = list(map(int, file.readline().split()))
+        values = np.fromstring(file.read(), dtype=np.float64, sep=' ')
+
+    # Parsing the first line to get N, K, and Mk values
+    N = first_line[0]  # Numero di oggetti
+    K = first_line[1]  # Numero di cluster
+    Mk = first_line[2:]  # Dimensione di ciascun cluster
+
+    if len(values) != N * (N - 1) // 2:
+        raise ValueError(f"{file_name}: expected {N * (N - 1) // 2} similarities, found {len(values)}")
+    return N, K, Mk, values
+
+
+def write_binary_header(file, N, K, Mk, dtype=np.float64):
+    # Header of a binary instance; the packed triangle follows it
+    file.write(BINARY_MAGIC)
+    file.write(np.array([BINARY_VERSION, np.dtype(dtype).itemsize, 0], dtype='<u4').tobytes())
+    file.write(np.array([N, K] + list(Mk), dtype='<i8').tobytes())
+
+
+def write_binary_instance(file_name, N, K, Mk, triangle, dtype=np.float64):
+    dtype = np.dtype(dtype)
+    with open(file_name, 'wb') as file:
+        write_binary_header(file, N, K, Mk, dtype)
+        file.write(np.ascontiguousarray(triangle, dtype=dtype.newbyteorder('<')).tobytes())
+
+
+def _read_binary_header(file_name):
+    # N, K, Mk, value dtype and offset of the triangle in a binary instance
+    with open(file_name, 'rb') as file:
+        if file.read(4) != BINARY_MAGIC:
+            raise ValueError(f"{file_name}: not a binary k-cluster instance")
+        version, itemsize, _ = np.frombuffer(file.read(12), dtype='<u4')
+        if version != BINARY_VERSION:
+            raise ValueError(f"{file_name}: unsupported binary version {version}")
+        N, K = np.frombuffer(file.read(16), dtype='<i8')
+        Mk = [int(m) for m in np.frombuffer(file.read(8 * int(K)), dtype='<i8')]
+        offset = file.tell()
+    return int(N), int(K), Mk, np.dtype('<f4' if itemsize == 4 else '<f8'), offset
+
+
+def read_binary_instance(file_name, mmap=True):
+    # Returns the packed triangle as a read-only np.memmap (no copy) unless mmap=False
+    N, K, Mk, dtype, offset = _read_binary_header(file_name)
+    length = N * (N - 1) // 2
+    if mmap:
+        values = np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(length,))
+    else:
+        values = np.fromfile(file_name, dtype=dtype, count=length, offset=offset)
+    return N, K, Mk, values
+
+
+def read_instance(file_name, mmap=True):
+    # N, K, Mk and the packed upper triangle, whatever the file format
+    if file_name.endswith(BINARY_EXTENSION):
+        return read_binary_instance(file_name, mmap=mmap)
+    return read_text_instance(file_name)
+
+
+def read_header(file_name):
+    # N, K and Mk without reading the similarities
+    if file_name.endswith(BINARY_EXTENSION):
+        return _read_binary_header(file_name)[:3]
+    with open(file_name, 'r') as file:
+        first_line = list(map(int, file.readline().split()))
+    return first_line[0], first_line[1], first_line[2:]
+
+
+def _text_values(file_name, chunk_bytes):
+    # The similarities of a text instance in chunks, a number split across chunks is carried over
+    with open(file_name, 'r') as file:
+        file.readline()
+        tail = ''
+        while True:
+            text = file.read(chunk_bytes)
+            if not text:
+                break
+            text = tail + text
+            split = max(text.rfind(' '), text.rfind('\n'))
+            if split < 0:
+                tail = text
+                continue
+            text, tail = text[:split], text[split:]
+            yield np.fromstring(text, dtype=np.float64, sep=' ')
+        if tail.strip():
+            yield np.fromstring(tail, dtype=np.float64, sep=' ')
+
+
+def iter_triangle_blocks(file_name, block_values=STREAM_BLOCK_VALUES, max_rows=None):
+    # Streams the packed upper triangle as (first_row, last_row, values) with whole rows only:
+    # values holds s[i, i+1:] for first_row <= i < last_row, at most block_values of them
+    # (or a single row if it is longer) and at most max_rows rows. Memory stays O(block_values)
+    # whatever N is.
+    N = read_header(file_name)[0]
+    if file_name.endswith(BINARY_EXTENSION):
+        _, _, _, dtype, offset = _read_binary_header(file_name)
+        triangle = np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(N * (N - 1) // 2,))
+        chunks = (triangle[start:start + block_values] for start in range(0, len(triangle), block_values))
+    else:
+        chunks = _text_values(file_name, 16 * block_values)
+
+    buffer = np.zeros(0)
+    row = 0
+    for chunk in chunks:
+        buffer = np.concatenate((buffer, chunk))
+        while row < N - 1 and len(buffer) >= N - 1 - row:
+            # Take as many whole rows as fit in the block
+            last_row = row
+            length = 0
+            while last_row < N - 1 and length + (N - 1 - last_row) <= max(block_values, N - 1 - row) and \
+                    length + (N - 1 - last_row) <= len(buffer) and last_row - row < (max_rows or N):
+                length += N - 1 - last_row
+                last_row += 1
+            yield row, last_row, buffer[:length].astype(np.float64)
+            buffer = buffer[length:]
+            row = last_row
+    if row < N - 1 or len(buffer):
+        raise ValueError(f"{file_name}: expected {N * (N - 1) // 2} similarities")
+
+
+def triangle_to_dense(N, triangle):
+    s = np.zeros((N, N), dtype=triangle.dtype)
+    rows, columns = np.triu_indices(N, 1)
+    s[rows, columns] = triangle
+    s[columns, rows] = triangle
+    return s
+
+
+def read_input(file_name):
+    # Same interface as the original per-script read_input: dense symmetric s
+    N, K, Mk, triangle = read_instance(file_name)
+    return N, K, Mk, triangle_to_dense(N, triangle)
+
+
+def convert_to_binary(file_name, output_file_name=None, dtype=np.float64):
+    if output_file_name is None:
+        output_file_name = file_name.rsplit('.', 1)[0] + BINARY_EXTENSION
+    N, K, Mk, triangle = read_text_instance(file_name)
+    write_binary_instance(output_file_name, N, K, Mk, triangle, dtype=dtype)
+    return output_file_name
+
+
+# Converter: python instance_io.py [--float32] kcluster40_*.txt
+def main():
+    arguments = sys.argv[1:]
+    dtype = np.float64
+    if '--float32' in arguments:
+        arguments.remove('--float32')
+        dtype = np.float32
+    for file_name in arguments:
+        print(convert_to_binary(file_name, dtype=dtype))
+
+
+if __name__ == "__main__":
+    main()
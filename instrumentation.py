@@ -0,0 +1,104 @@
+import cProfile
+import csv
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:  # optional, cProfile is always available
+    pyinstrument = None
+
+TRACE_FIELDS = ['solver', 'instance', 'time', 'objective', 'move_type', 'move_count']
+PHASE_FIELDS = ['solver', 'instance', 'phase', 'seconds']
+
+
+class Trace:
+    # Incumbent trace and per-phase timing of one heuristic run. The solvers take trace=None
+    # and only call record()/phase() when a Trace is passed, so untraced runs pay nothing.
+    # events: (seconds since start, objective, move type, moves so far) for every new incumbent
+    def __init__(self, start_time=None):
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.events = []
+        self.phases = {}
+
+    def record(self, objective, move_type, move_count, timestamp=None):
+        # timestamp: seconds since start when the event happened elsewhere (e.g. in a worker process)
+        if timestamp is None:
+            timestamp = time.perf_counter() - self.start_time
+        self.events.append((timestamp, float(objective), move_type, int(move_count)))
+
+    @contextmanager
+    def phase(self, name):
+        # Adds the time spent in the block to phases[name]; phases may be entered repeatedly
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def time_to_target(self, target):
+        # First time the incumbent reached target, None if it never did
+        for timestamp, objective, _, _ in self.events:
+            if objective >= target:
+                return timestamp
+        return None
+
+    def best(self):
+        return max(self.events, key=lambda event: event[1]) if self.events else None
+
+    def rows(self, solver='', instance=''):
+        return [dict(zip(TRACE_FIELDS, (solver, instance) + event)) for event in self.events]
+
+
+@contextmanager
+def phase(trace, name):
+    # trace.phase(name) when tracing, a no-op otherwise
+    if trace is None:
+        yield
+    else:
+        with trace.phase(name):
+            yield
+
+
+def write_trace(file_name, traces):
+    # traces: iterable of (solver, instance, Trace); one CSV for time-to-target plots across solvers
+    with open(file_name, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=TRACE_FIELDS)
+        writer.writeheader()
+        for solver, instance, trace in traces:
+            writer.writerows(trace.rows(solver, instance))
+
+
+def write_phases(file_name, traces):
+    # Per-phase time breakdown of every traced run
+    with open(file_name, 'w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(PHASE_FIELDS)
+        for solver, instance, trace in traces:
+            writer.writerows((solver, instance, name, seconds) for name, seconds in trace.phases.items())
+
+
+def profile(function, *args, profiler='cprofile', output_file_name=None, **kwargs):
+    # Runs function(*args, **kwargs) under cProfile or pyinstrument; the report goes to
+    # output_file_name (a .prof pstats dump for cProfile, text for pyinstrument) or is returned
+    # as text. Returns (result, report)
+    if profiler == 'pyinstrument':
+        if pyinstrument is None:
+            raise ImportError("pyinstrument is not installed, use profiler='cprofile'")
+        with pyinstrument.Profiler() as session:
+            result = function(*args, **kwargs)
+        report = session.output_text()
+        if output_file_name:
+            with open(output_file_name, 'w') as output_file:
+                output_file.write(report)
+        return result, report
+
+    session = cProfile.Profile()
+    result = session.runcall(function, *args, **kwargs)
+    if output_file_name:
+        session.dump_stats(output_file_name)
+    stream = io.StringIO()
+    pstats.Stats(session, stream=stream).sort_stats('cumulative').print_stats(25)
+    return result, stream.getvalue()
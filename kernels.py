@@ -0,0 +1,132 @@
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional; the kernels still run (slowly) as plain Python
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+# Local search backend used when none is requested: the vectorized NumPy search of SwapState
+# for best improvement, the compiled kernels for first improvement if numba is installed
+# (every process also pays for loading the compiled kernels from the cache on first use)
+DEFAULT_BACKEND = 'numpy'
+FIRST_IMPROVEMENT_BACKEND = 'kernel' if NUMBA_AVAILABLE else 'numpy'
+BACKENDS = ('numpy', 'kernel')
+
+
+def slot_index(clusters, outside_items, N):
+    # Position index over the items: slots holds the members of cluster 0, 1, ..., K-1 and then
+    # the outside items; position[i] is the slot of item i. A swap exchanges two slots in O(1)
+    # instead of list.remove/append. offsets[k]:offsets[k + 1] are the slots of cluster k.
+    slots = np.array([item for cluster in clusters for item in cluster] + list(outside_items), dtype=np.int64)
+    position = np.empty(N, dtype=np.int64)
+    position[slots] = np.arange(len(slots))
+    offsets = np.concatenate(([0], np.cumsum([len(cluster) for cluster in clusters]))).astype(np.int64)
+    return slots, position, offsets
+
+
+@njit(cache=True)
+def swap_gain(s, gain, assignment, item_a, item_b):
+    # Same formula as SwapState.swap_gain
+    cluster_a = assignment[item_a]
+    cluster_b = assignment[item_b]
+    if cluster_a == cluster_b:
+        return 0.0
+    delta = 0.0
+    if cluster_a >= 0:
+        delta += gain[item_b, cluster_a] - gain[item_a, cluster_a] - s[item_a, item_b]
+    if cluster_b >= 0:
+        delta += gain[item_a, cluster_b] - gain[item_b, cluster_b] - s[item_a, item_b]
+    return delta
+
+
+@njit(cache=True)
+def apply_swap(s, gain, assignment, slots, position, item_a, item_b):
+    # O(N) gain update (rows of the symmetric s) and O(1) slot exchange
+    cluster_a = assignment[item_a]
+    cluster_b = assignment[item_b]
+    N = s.shape[0]
+    if cluster_a >= 0:
+        for i in range(N):
+            gain[i, cluster_a] += s[item_b, i] - s[item_a, i]
+    if cluster_b >= 0:
+        for i in range(N):
+            gain[i, cluster_b] += s[item_a, i] - s[item_b, i]
+    assignment[item_a] = cluster_b
+    assignment[item_b] = cluster_a
+    slot_a = position[item_a]
+    slot_b = position[item_b]
+    slots[slot_a] = item_b
+    slots[slot_b] = item_a
+    position[item_a] = slot_b
+    position[item_b] = slot_a
+
+
+@njit(cache=True)
+def search(s, gain, assignment, slots, position, first_improvement, max_moves, tolerance):
+    # Up to max_moves improving swaps between a clustered item a and any item b of another cluster
+    # or outside (assignment -2 marks removed items, never swapped in), scanned in the same (a, b)
+    # order as SwapState.best_move. Returns cluster swaps, outside swaps, objective change and
+    # whether a local optimum was reached.
+    N = s.shape[0]
+    K = gain.shape[1]
+    clustered_count = 0
+    for item in range(N):
+        if assignment[item] >= 0:
+            clustered_count += 1
+    # own[i] = gain[i, assignment[i]] (0 outside) and gain transposed, so that the inner loop
+    # over b reads contiguous rows; both are refreshed after every move
+    own = np.zeros(N)
+    gain_by_cluster = np.empty((K, N))
+    cluster_swaps = 0
+    outside_swaps = 0
+    delta = 0.0
+    for _ in range(max_moves):
+        for item in range(N):
+            if assignment[item] >= 0:
+                own[item] = gain[item, assignment[item]]
+            else:
+                own[item] = 0.0
+            for cluster_index in range(K):
+                gain_by_cluster[cluster_index, item] = gain[item, cluster_index]
+        # The clustered items are the first slots; sorted to scan them in item order
+        clustered = np.sort(slots[:clustered_count])
+        best_gain = -np.inf
+        best_a = -1
+        best_b = -1
+        for item_a in clustered:
+            cluster_a = assignment[item_a]
+            own_a = own[item_a]
+            gain_a = gain[item_a]
+            gain_to_a = gain_by_cluster[cluster_a]
+            s_a = s[item_a]
+            for item_b in range(N):
+                cluster_b = assignment[item_b]
+                if cluster_b == cluster_a or cluster_b < -1:
+                    continue
+                # Same terms, in the same order, as SwapState.move_gains
+                move_gain = gain_to_a[item_b] - own_a - s_a[item_b]
+                if cluster_b >= 0:
+                    move_gain += gain_a[cluster_b] - own[item_b] - s_a[item_b]
+                if move_gain > best_gain:
+                    best_gain = move_gain
+                    best_a = item_a
+                    best_b = item_b
+                    if first_improvement and best_gain > tolerance:
+                        break
+            if first_improvement and best_gain > tolerance:
+                break
+        if best_gain <= tolerance:
+            return cluster_swaps, outside_swaps, delta, True
+        if assignment[best_b] >= 0:
+            cluster_swaps += 1
+        else:
+            outside_swaps += 1
+        apply_swap(s, gain, assignment, slots, position, best_a, best_b)
+        delta += best_gain
+    return cluster_swaps, outside_swaps, delta, False
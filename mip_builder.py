@@ -0,0 +1,425 @@
+import time
+
+import numpy as np
+from mip import BINARY, ConstrsGenerator, LinExpr, Model, OptimizationStatus, maximize
+
+from Heuristic2o3 import compute_objective
+from bounds import eigenvalue_bound
+from similarity import upper_triangle
+
+FORMULATIONS = ('F1', 'F2')
+
+# Minimum violation for a separated constraint to be added
+SEPARATION_TOLERANCE = 1e-6
+
+
+class LinkingConstraintGenerator(ConstrsGenerator):
+    # Separates the pair-linking rows left out of the initial model:
+    # F1: y[p][k] <= x[i][k] and y[p][k] <= x[j][k]; F2: y[p][k] >= x[i][k] + x[j][k] - 1.
+    # With triangle_cuts (F1 only) it also separates y_ij + y_il - y_jl <= x_i, which holds for every
+    # solution with y = x_i * x_j and therefore for an optimal one, since the kept pairs have s > 0.
+    def __init__(self, formulation, x_flat, pairs, y_flat, N, K, triangle_cuts=False, max_constraints=1000):
+        self.formulation = formulation
+        self.x_flat = x_flat
+        self.y_flat = y_flat
+        self.N = N
+        self.K = K
+        self.pair_i = np.array([i for i, _ in pairs], dtype=np.int64)
+        self.pair_j = np.array([j for _, j in pairs], dtype=np.int64)
+        self.triangle_cuts = triangle_cuts
+        self.max_constraints = max_constraints
+
+    def generate_constrs(self, model, depth=0, npass=0):
+        x_vars = model.translate(self.x_flat)
+        y_vars = model.translate(self.y_flat)
+        x_values = np.array([v.x if v is not None else 0.0 for v in x_vars]).reshape(self.N, self.K)
+        y_values = np.array([v.x if v is not None else 0.0 for v in y_vars]).reshape(-1, self.K)
+
+        # (violation, variables, coefficients, const) of every violated row
+        found = []
+        if self.formulation == 'F1':
+            for items in (self.pair_i, self.pair_j):
+                violation = y_values - x_values[items]
+                for p, k in zip(*np.nonzero(violation > SEPARATION_TOLERANCE)):
+                    found.append((violation[p, k], [y_vars[p * self.K + k], x_vars[items[p] * self.K + k]],
+                                  [1, -1], 0))
+        else:
+            violation = x_values[self.pair_i] + x_values[self.pair_j] - 1 - y_values
+            for p, k in zip(*np.nonzero(violation > SEPARATION_TOLERANCE)):
+                found.append((violation[p, k], [y_vars[p * self.K + k], x_vars[self.pair_i[p] * self.K + k],
+                                                x_vars[self.pair_j[p] * self.K + k]], [-1, 1, 1], -1))
+        if self.triangle_cuts and self.formulation == 'F1':
+            found += self._separate_triangles(x_vars, y_vars, x_values, y_values)
+
+        found.sort(key=lambda row: row[0], reverse=True)
+        for _, variables, coefficients, const in found[:self.max_constraints]:
+            if all(v is not None for v in variables):
+                model += LinExpr(variables, coefficients, const=const, sense='<')
+
+    def _separate_triangles(self, x_vars, y_vars, x_values, y_values):
+        # Dense pair matrices per cluster; pairs without a y variable cannot take part in a cut
+        index = np.full((self.N, self.N), -1, dtype=np.int64)
+        index[self.pair_i, self.pair_j] = np.arange(len(self.pair_i))
+        index[self.pair_j, self.pair_i] = np.arange(len(self.pair_i))
+        upper = np.triu(np.ones((self.N, self.N), dtype=bool), 1)
+        found = []
+        for k in range(self.K):
+            Y = np.zeros((self.N, self.N))
+            Y[self.pair_i, self.pair_j] = y_values[:, k]
+            Y[self.pair_j, self.pair_i] = y_values[:, k]
+            for i in range(self.N):
+                # violation[j, l] = y_ij + y_il - y_jl - x_i for j < l, all three pairs present
+                violation = Y[i][:, None] + Y[i][None, :] - Y - x_values[i, k]
+                present = (index[i][:, None] >= 0) & (index[i][None, :] >= 0) & (index >= 0) & upper
+                for j, l in zip(*np.nonzero(present & (violation > SEPARATION_TOLERANCE))):
+                    found.append((violation[j, l],
+                                  [y_vars[index[i, j] * self.K + k], y_vars[index[i, l] * self.K + k],
+                                   y_vars[index[j, l] * self.K + k], x_vars[i * self.K + k]], [1, 1, -1, -1], 0))
+        return found
+
+
+def equal_size_groups(Mk):
+    # Cluster indices grouped by cardinality (only groups with two or more clusters)
+    groups = {}
+    for k, size in enumerate(Mk):
+        groups.setdefault(size, []).append(k)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def order_for_symmetry(clusters, Mk):
+    # Relabel equal-size clusters so their lowest-indexed items increase with k,
+    # as required by the symmetry-breaking constraints
+    clusters = [list(cluster) for cluster in clusters]
+    for group in equal_size_groups(Mk):
+        ordered = sorted((clusters[k] for k in group), key=lambda cluster: min(cluster, default=len(Mk)))
+        for k, cluster in zip(group, ordered):
+            clusters[k] = cluster
+    return clusters
+
+
+def build_model(N, K, Mk, s, formulation='F1', lp_file_name=None, sparse=True, symmetry_breaking=False,
+                lazy_linking=False, cardinality_cuts=False, triangle_cuts=False):
+    # Builds F1 or F2 with unnamed variables created in bulk and constraints assembled
+    # directly as LinExpr objects (no operator overloading, no name formatting).
+    # sparse: in F1, pairs with s[i, j] <= 0 get no y variables, since y is only bounded
+    # from above there and such a y never improves the objective. F2 needs every pair.
+    # symmetry_breaking: among clusters of equal size, the lowest-indexed item of cluster k
+    # must precede the one of the next cluster of the group, removing the K! relabelings.
+    # lazy_linking: the O(N^2 K) pair-linking rows are not added up front but separated by a
+    # LinkingConstraintGenerator (lazily on integer solutions, and as cuts if triangle_cuts is set).
+    # cardinality_cuts (F1): sum_j y_ijk <= (Mk - 1) x_ik, always on with lazy_linking.
+    # triangle_cuts: F1 triangle inequalities separated as cuts; in F2 only the lazy linking rows.
+    # Returns model, x[i][k], pairs (i, j), y[p][k] and the build time.
+    if formulation not in FORMULATIONS:
+        raise ValueError(f"unknown formulation {formulation!r}, expected one of {FORMULATIONS}")
+    model = Model()
+    start_time = time.time()
+
+    # Pairs i < j with a y variable, in packed upper-triangle order
+    weights = upper_triangle(s)
+    pair_i, pair_j = np.triu_indices(N, 1)
+    if sparse and formulation == 'F1':
+        keep = weights > 0
+        weights, pair_i, pair_j = weights[keep], pair_i[keep], pair_j[keep]
+    pairs = list(zip(pair_i.tolist(), pair_j.tolist()))
+
+    # binary variable indicating whether items i and j are in the same cluster k(=1) or not (=0)
+    y_flat = model.add_vars(len(pairs) * K, var_type=BINARY)
+    y = [y_flat[p * K:(p + 1) * K] for p in range(len(pairs))]
+
+    # binary variable indicating whether item i is in cluster k(=1) or not(=0)
+    x_flat = model.add_vars(N * K, var_type=BINARY)
+    x = [x_flat[i * K:(i + 1) * K] for i in range(N)]
+
+    # constraint: each item i to belong to one cluster at most
+    for i in range(N):
+        model.add_constr(LinExpr(x[i], [1] * K, sense='<', const=-1))
+
+    # constraint: do not allow violation of the number of items in each cluster
+    for k in range(K):
+        model.add_constr(LinExpr([x[i][k] for i in range(N)], [1] * N, sense='=', const=-Mk[k]))
+
+    incident = [[] for _ in range(N)]
+    for p, (i, j) in enumerate(pairs):
+        incident[i].append(p)
+        incident[j].append(p)
+
+    if formulation == 'F1' and (cardinality_cuts or lazy_linking):
+        # constraint: item i shares cluster k with at most Mk - 1 other items. Always added with lazy
+        # linking: on integer points these rows already imply y_ijk <= x_ik, x_jk, and without them
+        # CBC can certify wrong optima from incumbents whose linking rows were never separated
+        for i in range(N):
+            for k in range(K):
+                variables = [y[p][k] for p in incident[i]] + [x[i][k]]
+                model.add_constr(LinExpr(variables, [1] * len(incident[i]) + [1 - Mk[k]], sense='<'))
+
+    if lazy_linking:
+        # pair-linking rows are separated on demand
+        model.lazy_constrs_generator = LinkingConstraintGenerator(formulation, x_flat, pairs, y_flat, N, K)
+    elif formulation == 'F1':
+        # constraint: yijk = 1 whenever xik = xjk = 1, yijk = 0 otherwise
+        for p, (i, j) in enumerate(pairs):
+            for k in range(K):
+                model.add_constr(LinExpr([y[p][k], x[i][k]], [1, -1], sense='<'))
+                model.add_constr(LinExpr([y[p][k], x[j][k]], [1, -1], sense='<'))
+    else:
+        # constraint: yijk = 1 whenever xik = 1 = xjk
+        for p, (i, j) in enumerate(pairs):
+            for k in range(K):
+                model.add_constr(LinExpr([y[p][k], x[i][k], x[j][k]], [1, -1, -1], sense='>', const=1))
+
+    # F2 has no triangle cuts: without lazy linking all its linking rows are in the model already
+    # and the generator would find nothing to separate
+    if triangle_cuts and (formulation == 'F1' or lazy_linking):
+        model.cuts_generator = LinkingConstraintGenerator(formulation, x_flat, pairs, y_flat, N, K, triangle_cuts=True)
+
+    if formulation == 'F2':
+        # constraint: force yijk = 1 for Mk-1 variables yijk, for fixed j and k
+        for j in range(N):
+            for k in range(K):
+                variables = [y[p][k] for p in incident[j]] + [x[j][k]]
+                model.add_constr(LinExpr(variables, [1] * len(incident[j]) + [1 - Mk[k]], sense='='))
+
+    # constraint: item i may join cluster k2 only if a lower-indexed item is already in the
+    # previous equal-size cluster k1, i.e. min(cluster k1) < min(cluster k2)
+    if symmetry_breaking:
+        for group in equal_size_groups(Mk):
+            for k1, k2 in zip(group, group[1:]):
+                for i in range(N):
+                    model.add_constr(LinExpr([x[i][k2]] + [x[j][k1] for j in range(i)], [1] + [-1] * i, sense='<'))
+
+    # objective function: maximize the sum of similarities
+    model.objective = maximize(LinExpr(y_flat, np.repeat(weights, K).tolist()))
+
+    build_time = time.time() - start_time
+    if lp_file_name is not None:
+        model.write(lp_file_name)
+    return model, x, pairs, y, build_time
+
+
+def set_warm_start(model, x, pairs, y, clusters, objective_value):
+    # Feed a heuristic solution as MIP start and use its objective as cutoff, in the model's
+    # maximization sense: solutions below it are pruned (with a small tolerance, so that the
+    # start itself is not cut off)
+    K = len(clusters)
+    assignment = {i: k for k in range(K) for i in clusters[k]}
+    start = [(x[i][k], 1.0 if assignment.get(i) == k else 0.0) for i in range(len(x)) for k in range(K)]
+    for p, (i, j) in enumerate(pairs):
+        for k in range(K):
+            start.append((y[p][k], 1.0 if assignment.get(i) == k and assignment.get(j) == k else 0.0))
+    model.start = start
+    model.cutoff = objective_value - 1e-6
+
+
+def solve_model(model, x, N, K, time_limit=600):
+    # Solving the model and measuring the time
+    start_time = time.time()
+    status = model.optimize(max_seconds=time_limit)
+    solution_time = time.time() - start_time
+
+    # Best objective solution, optimality and upper bound
+    best_solution = model.objective_value
+    is_optimal = status == OptimizationStatus.OPTIMAL
+    upper_bound = model.objective_bound
+
+    # Clusters of the best solution found
+    clusters = [[i for i in range(N) if x[i][k].x is not None and x[i][k].x >= 0.99] for k in range(K)]
+
+    return clusters, best_solution, is_optimal, upper_bound, solution_time
+
+
+def feasible_clusters(clusters, Mk):
+    # True if cluster k has exactly Mk[k] items and no item is in two clusters
+    return [len(cluster) for cluster in clusters] == list(Mk) and \
+        len({item for cluster in clusters for item in cluster}) == sum(Mk)
+
+
+def solve(N, K, Mk, s, formulation='F1', time_limit=600, lp_file_name=None, sparse=True, symmetry_breaking=False,
+          warm_start=None, lazy_linking=False, cardinality_cuts=False, triangle_cuts=False):
+    # Build and solve; returns clusters, objective, optimality, bound, solution time and build time.
+    # warm_start: clusters of a known solution (e.g. from Heuristic2o3) used as MIP start and cutoff
+    model, x, pairs, y, build_time = build_model(N, K, Mk, s, formulation, lp_file_name, sparse, symmetry_breaking,
+                                                 lazy_linking, cardinality_cuts, triangle_cuts)
+    if warm_start is not None:
+        if symmetry_breaking:
+            warm_start = order_for_symmetry(warm_start, Mk)
+        start_objective = compute_objective(warm_start, s)
+        set_warm_start(model, x, pairs, y, warm_start, start_objective)
+    clusters, best_solution, is_optimal, upper_bound, solution_time = solve_model(model, x, N, K, time_limit)
+    # The reported objective is the one the clusters achieve: with lazy linking the incumbent may
+    # violate linking rows that were never separated, and then model.objective_value overstates it
+    if feasible_clusters(clusters, Mk):
+        best_solution = compute_objective(clusters, s)
+        if model.objective_value is not None and \
+                best_solution < model.objective_value - SEPARATION_TOLERANCE * max(1.0, abs(best_solution)):
+            is_optimal = False
+    else:
+        best_solution = None
+        is_optimal = False
+    if warm_start is not None:
+        tolerance = SEPARATION_TOLERANCE * max(1.0, abs(start_objective))
+        if model.status == OptimizationStatus.INFEASIBLE:
+            # Infeasible under the cutoff: no solution is better than the start
+            return warm_start, start_objective, True, start_objective, solution_time, build_time
+        # With a MIP start CBC may report a solution while x does not hold the incumbent, so the
+        # solver's clusters are only used if they are feasible and better than the start. The start
+        # is optimal if CBC proved an optimum of the start's value
+        if best_solution is None or best_solution <= start_objective + tolerance:
+            is_optimal = model.status == OptimizationStatus.OPTIMAL and model.objective_value is not None and \
+                model.objective_value <= start_objective + tolerance
+            clusters, best_solution = warm_start, start_objective
+    return clusters, best_solution, is_optimal, upper_bound, solution_time, build_time
+
+
+class TransitivityGenerator(ConstrsGenerator):
+    # Separates z_ij + z_il - z_jl <= x_i for the compact formulation. Within a group of equal-size
+    # clusters this makes "same cluster" an equivalence relation on the selected items; for a size
+    # used by a single cluster it is a valid cut (z = x_i * x_j there)
+    def __init__(self, x_flat, pairs, z_flat, N, G, groups, max_constraints=1000):
+        self.x_flat = x_flat
+        self.z_flat = z_flat
+        self.N = N
+        self.G = G
+        self.groups = groups
+        self.pair_i = np.array([i for i, _ in pairs], dtype=np.int64)
+        self.pair_j = np.array([j for _, j in pairs], dtype=np.int64)
+        self.max_constraints = max_constraints
+
+    def generate_constrs(self, model, depth=0, npass=0):
+        x_vars = model.translate(self.x_flat)
+        z_vars = model.translate(self.z_flat)
+        x_values = np.array([v.x if v is not None else 0.0 for v in x_vars]).reshape(self.N, self.G)
+        z_values = np.array([v.x if v is not None else 0.0 for v in z_vars]).reshape(-1, self.G)
+        index = np.zeros((self.N, self.N), dtype=np.int64)
+        index[self.pair_i, self.pair_j] = np.arange(len(self.pair_i))
+        index[self.pair_j, self.pair_i] = np.arange(len(self.pair_i))
+        upper = np.triu(np.ones((self.N, self.N), dtype=bool), 1)
+
+        found = []
+        for g in self.groups:
+            Z = np.zeros((self.N, self.N))
+            Z[self.pair_i, self.pair_j] = z_values[:, g]
+            Z[self.pair_j, self.pair_i] = z_values[:, g]
+            for i in range(self.N):
+                # violation[j, l] = z_ij + z_il - z_jl - x_i for j < l, both different from i
+                violation = Z[i][:, None] + Z[i][None, :] - Z - x_values[i, g]
+                violation[i, :] = 0
+                violation[:, i] = 0
+                for j, l in zip(*np.nonzero(upper & (violation > SEPARATION_TOLERANCE))):
+                    found.append((violation[j, l], [z_vars[index[i, j] * self.G + g], z_vars[index[i, l] * self.G + g],
+                                                    z_vars[index[j, l] * self.G + g], x_vars[i * self.G + g]]))
+
+        found.sort(key=lambda row: row[0], reverse=True)
+        for _, variables in found[:self.max_constraints]:
+            if all(v is not None for v in variables):
+                model += LinExpr(variables, [1, 1, -1, -1], sense='<')
+
+
+def cardinality_groups(Mk):
+    # Distinct cluster sizes and the cluster indices having each size, in first-seen order
+    groups = {}
+    for k, size in enumerate(Mk):
+        groups.setdefault(size, []).append(k)
+    return list(groups.items())
+
+
+def build_compact_model(N, K, Mk, s, lp_file_name=None):
+    # Symmetry-free formulation without the cluster index: x[i][g] selects item i for the
+    # clusters of size group g, z[p][g] = 1 if the items of pair p share a cluster of group g.
+    # For K=1 (and any size used by a single cluster) this is the quadratic-knapsack / densest
+    # subgraph model; for equal-size groups transitivity rows are separated lazily.
+    # Pair variables grow with the number of distinct sizes instead of K.
+    model = Model()
+    start_time = time.time()
+    groups = cardinality_groups(Mk)
+    G = len(groups)
+
+    weights = upper_triangle(s)
+    pair_i, pair_j = np.triu_indices(N, 1)
+    pairs = list(zip(pair_i.tolist(), pair_j.tolist()))
+
+    z_flat = model.add_vars(len(pairs) * G, var_type=BINARY)
+    z = [z_flat[p * G:(p + 1) * G] for p in range(len(pairs))]
+    x_flat = model.add_vars(N * G, var_type=BINARY)
+    x = [x_flat[i * G:(i + 1) * G] for i in range(N)]
+
+    # constraint: each item i to belong to one group at most
+    for i in range(N):
+        model.add_constr(LinExpr(x[i], [1] * G, sense='<', const=-1))
+
+    # constraint: group g selects size * (number of clusters) items
+    for g, (size, members) in enumerate(groups):
+        model.add_constr(LinExpr([x[i][g] for i in range(N)], [1] * N, sense='=', const=-size * len(members)))
+
+    # constraint: pairs only inside the selected items of the group
+    for p, (i, j) in enumerate(pairs):
+        for g in range(G):
+            model.add_constr(LinExpr([z[p][g], x[i][g]], [1, -1], sense='<'))
+            model.add_constr(LinExpr([z[p][g], x[j][g]], [1, -1], sense='<'))
+
+    # constraint: a selected item shares its cluster with exactly size - 1 items
+    incident = [[] for _ in range(N)]
+    for p, (i, j) in enumerate(pairs):
+        incident[i].append(p)
+        incident[j].append(p)
+    for i in range(N):
+        for g, (size, _) in enumerate(groups):
+            variables = [z[p][g] for p in incident[i]] + [x[i][g]]
+            model.add_constr(LinExpr(variables, [1] * len(incident[i]) + [1 - size], sense='='))
+
+    # transitivity is required for groups of several clusters and a valid cut for the others
+    multi_cluster_groups = [g for g, (_, members) in enumerate(groups) if len(members) > 1]
+    if multi_cluster_groups:
+        model.lazy_constrs_generator = TransitivityGenerator(x_flat, pairs, z_flat, N, G, multi_cluster_groups)
+    model.cuts_generator = TransitivityGenerator(x_flat, pairs, z_flat, N, G, list(range(G)))
+
+    # objective function: maximize the sum of similarities
+    model.objective = maximize(LinExpr(z_flat, np.repeat(weights, G).tolist()))
+
+    build_time = time.time() - start_time
+    if lp_file_name is not None:
+        model.write(lp_file_name)
+    return model, x, pairs, z, groups, build_time
+
+
+def compact_clusters(x, pairs, z, groups, N, K):
+    # Recover the K clusters from the group-level solution: each group's selected items
+    # split into the connected components of its z graph
+    clusters = [[] for _ in range(K)]
+    for g, (_, members) in enumerate(groups):
+        neighbours = {i: [] for i in range(N) if x[i][g].x is not None and x[i][g].x >= 0.99}
+        for p, (i, j) in enumerate(pairs):
+            if z[p][g].x is not None and z[p][g].x >= 0.99:
+                neighbours[i].append(j)
+                neighbours[j].append(i)
+        components = []
+        unvisited = set(neighbours)
+        while unvisited:
+            stack = [min(unvisited)]
+            component = []
+            while stack:
+                item = stack.pop()
+                if item in unvisited:
+                    unvisited.remove(item)
+                    component.append(item)
+                    stack += neighbours[item]
+            components.append(sorted(component))
+        for k, component in zip(members, sorted(components)):
+            clusters[k] = component
+    return clusters
+
+
+def solve_compact(N, K, Mk, s, time_limit=600, lp_file_name=None):
+    # Same result tuple as solve(); the reported bound is the better of the MIP and eigenvalue bounds
+    model, x, pairs, z, groups, build_time = build_compact_model(N, K, Mk, s, lp_file_name)
+    start_time = time.time()
+    status = model.optimize(max_seconds=time_limit)
+    solution_time = time.time() - start_time
+
+    best_solution = model.objective_value
+    is_optimal = status == OptimizationStatus.OPTIMAL
+    upper_bound = eigenvalue_bound(s, Mk)
+    if model.objective_bound is not None:
+        upper_bound = min(upper_bound, model.objective_bound)
+    clusters = compact_clusters(x, pairs, z, groups, N, K) if model.num_solutions else [[] for _ in range(K)]
+    return clusters, best_solution, is_optimal, upper_bound, solution_time, build_time
@@ -0,0 +1,253 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from bounds import gap_closed, optimality_gap, upper_bound as compute_upper_bound
+from Heuristic2o3 import IMPROVEMENT_TOLERANCE, MOVE_BLOCK_CELLS, SwapState, greedy_construction, local_search, perturb
+from instance_io import read_input
+from instrumentation import phase
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional, labels are then matched greedily
+    linear_sum_assignment = None
+
+
+def align_labels(assignment, reference, Mk):
+    # Copy of assignment with its cluster labels permuted to agree with reference on as many items
+    # as possible. Clusters of equal size are interchangeable, so only labels with the same Mk
+    # are permuted among each other; outside items (-1) keep their label.
+    K = len(Mk)
+    both = (assignment >= 0) & (reference >= 0)
+    overlap = np.zeros((K, K))
+    np.add.at(overlap, (assignment[both], reference[both]), 1)
+    labels = np.arange(K)
+    for size in set(Mk):
+        group = np.flatnonzero(np.asarray(Mk) == size)
+        if len(group) < 2:
+            continue
+        weights = overlap[np.ix_(group, group)]
+        if linear_sum_assignment is not None:
+            rows, columns = linear_sum_assignment(weights, maximize=True)
+        else:
+            rows, columns = [], []
+            for index in np.argsort(weights, axis=None)[::-1]:
+                row, column = divmod(int(index), len(group))
+                if row not in rows and column not in columns:
+                    rows.append(row)
+                    columns.append(column)
+        labels[group[rows]] = group[columns]
+    return np.where(assignment >= 0, labels[np.maximum(assignment, 0)], assignment)
+
+
+def label_distance(assignment_a, assignment_b, Mk):
+    # Items placed differently once the labels of b are aligned with a: 0 for solutions that only
+    # differ by a permutation of equal-size clusters, 2 for a single swap apart
+    return int(np.count_nonzero(assignment_a != align_labels(assignment_b, assignment_a, Mk)))
+
+
+def path_relink(s, K, Mk, initiating, guiding, deadline):
+    # Walks from the initiating to the guiding local optimum through the swap neighbourhood: every
+    # step puts one misplaced clustered item where the guide has it, exchanging it with a misplaced
+    # item sitting there, and takes the best such swap. Returns the state of the best solution
+    # strictly between the two ends, or None if they are less than two swaps apart.
+    guiding = align_labels(guiding, initiating, Mk)
+    state = SwapState.from_assignment(s, K, initiating)
+    best_objective, best_assignment = -np.inf, None
+    block_size = max(1, MOVE_BLOCK_CELLS // len(guiding))
+    while time.time() < deadline:
+        misplaced = state.assignment != guiding
+        sources = np.flatnonzero(misplaced & (state.assignment >= 0))
+        if len(sources) == 0:
+            break
+        best = (-np.inf, None, None)
+        for start in range(0, len(sources), block_size):
+            rows, gains = state.move_gains(sources[start:start + block_size])
+            gains[(state.assignment[None, :] != guiding[rows][:, None]) | ~misplaced[None, :]] = -np.inf
+            row, column = np.unravel_index(np.argmax(gains), gains.shape)
+            if gains[row, column] > best[0]:
+                best = (gains[row, column], rows[row], column)
+        state.apply_swap(int(best[1]), int(best[2]))
+        if np.array_equal(state.assignment, guiding):
+            break
+        if state.objective > best_objective:
+            best_objective, best_assignment = state.objective, state.assignment.copy()
+    if best_assignment is None:
+        return None
+    return SwapState.from_assignment(s, K, best_assignment)
+
+
+def update_elite(elite, objective, assignment, Mk, elite_size, min_distance):
+    # Pool of diverse local optima, best first. A solution closer than min_distance (label-invariant)
+    # to pool members only enters by beating all of them and then replaces them; a distant one
+    # enters while the pool has room or when it beats the worst member. Returns whether it entered.
+    close = [index for index, (_, member) in enumerate(elite) if label_distance(member, assignment, Mk) < min_distance]
+    if any(objective <= elite[index][0] + IMPROVEMENT_TOLERANCE for index in close):
+        return False
+    if not close and len(elite) >= elite_size and objective <= elite[-1][0] + IMPROVEMENT_TOLERANCE:
+        return False
+    for index in reversed(close):
+        del elite[index]
+    elite.append((objective, assignment.copy()))
+    elite.sort(key=lambda solution: solution[0], reverse=True)
+    del elite[elite_size:]
+    return True
+
+
+def _publish(incumbent, state, start_time, iterations=0):
+    # Copy state into the shared incumbent if it is better; with tracing the new incumbent
+    # is also sent to the parent process
+    with incumbent['lock']:
+        if state.objective > incumbent['objective'].value:
+            incumbent['objective'].value = state.objective
+            incumbent['assignment'][:] = state.assignment
+            incumbent['time_to_best'].value = time.time() - start_time
+            if incumbent['events'] is not None:
+                incumbent['events'].put((incumbent['time_to_best'].value, state.objective, iterations))
+
+
+def _worker(worker_id, N, K, Mk, s, incumbent, deadline, start_time, seed, elite_size, candidate_count,
+            restart_probability, perturbation_strength, relink_probability, elite_distance, upper_bound,
+            gap_tolerance):
+    # Iterated local search with path relinking: restart from a randomized construction, relink
+    # an elite solution towards another one (own pool or the shared incumbent), or perturb an elite
+    # solution, and descend again
+    rng = np.random.default_rng(seed)
+    elite = []  # (objective, assignment) diverse local optima found by this worker, best first
+    iterations = 0
+    while time.time() < deadline and not gap_closed(incumbent['objective'].value, upper_bound, gap_tolerance):
+        choice = rng.random()
+        state = None
+        if not elite or choice < restart_probability:
+            clusters, outside_items = greedy_construction(N, K, Mk, s, rng, candidate_count)
+            state = SwapState(s, clusters, outside_items)
+        elif choice < restart_probability + relink_probability:
+            first = int(rng.integers(len(elite)))
+            if len(elite) > 1 and rng.random() < 0.5:
+                guiding = elite[(first + int(rng.integers(1, len(elite)))) % len(elite)][1]
+            else:
+                with incumbent['lock']:
+                    guiding = np.array(incumbent['assignment'][:], dtype=np.int64)
+            initiating = elite[first][1]
+            if rng.random() < 0.5:
+                initiating, guiding = guiding, initiating
+            state = path_relink(s, K, Mk, initiating, guiding, deadline)
+        if state is None:
+            if rng.random() < 0.5:
+                with incumbent['lock']:
+                    assignment = np.array(incumbent['assignment'][:], dtype=np.int64)
+            else:
+                assignment = elite[rng.integers(len(elite))][1]
+            state = SwapState.from_assignment(s, K, assignment)
+            perturb(state, int(rng.integers(1, perturbation_strength + 1)), rng)
+        local_search(state, deadline)
+        iterations += 1
+
+        update_elite(elite, state.objective, state.assignment, Mk, elite_size, elite_distance)
+        _publish(incumbent, state, start_time, iterations)
+    incumbent['iterations'][worker_id] = iterations
+
+
+def multi_start(N, K, Mk, s, time_limit=600, workers=None, seed=None, elite_size=10, candidate_count=3,
+                restart_probability=0.2, perturbation_strength=None, relink_probability=0.3, elite_distance=None,
+                upper_bound=None, gap_tolerance=0.0, trace=None):
+    # Parallel GRASP/ILS with path relinking; the incumbent is shared between worker processes through
+    # shared memory. Each worker keeps an elite pool whose members are at least elite_distance items
+    # apart once equal-size cluster labels are matched (default: the perturbation strength).
+    # With an upper_bound every worker stops once the incumbent's optimality gap is at most gap_tolerance.
+    # trace: optional instrumentation.Trace; worker incumbents are recorded with move type 'ils'
+    # and the local searches completed by that worker as move count.
+    # Returns clusters, objective value, total local searches, time to best and total time.
+    start_time = time.time()
+    deadline = start_time + time_limit
+    workers = workers or os.cpu_count()
+    if perturbation_strength is None:
+        perturbation_strength = max(2, sum(Mk) // 10)
+    if elite_distance is None:
+        elite_distance = perturbation_strength
+
+    # Start from the deterministic heuristic so the result is never worse than it
+    clusters, outside_items = greedy_construction(N, K, Mk, s, trace=trace)
+    state = SwapState(s, clusters, outside_items)
+    if trace is not None:
+        trace.record(state.objective, 'construction', 0)
+    with phase(trace, 'local search'):
+        local_search(state, deadline, trace=trace)
+
+    incumbent = {
+        'lock': multiprocessing.Lock(),
+        'objective': multiprocessing.Value('d', state.objective, lock=False),
+        'assignment': multiprocessing.Array('q', state.assignment.tolist(), lock=False),
+        'time_to_best': multiprocessing.Value('d', time.time() - start_time, lock=False),
+        'iterations': multiprocessing.Array('q', workers, lock=False),
+        'events': multiprocessing.Queue() if trace is not None else None,
+    }
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    processes = [multiprocessing.Process(target=_worker,
+                                         args=(worker_id, N, K, Mk, s, incumbent, deadline, start_time,
+                                               seeds[worker_id], elite_size, candidate_count,
+                                               restart_probability, perturbation_strength, relink_probability,
+                                               elite_distance, upper_bound, gap_tolerance))
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+    with phase(trace, 'multi-start'):
+        if trace is not None:
+            # Drain the incumbent events while the workers run (a full queue would block them)
+            offset = (time.perf_counter() - trace.start_time) - (time.time() - start_time)
+            while any(process.is_alive() for process in processes) or not incumbent['events'].empty():
+                try:
+                    event_time, objective, iterations = incumbent['events'].get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                trace.record(objective, 'ils', iterations, timestamp=event_time + offset)
+        for process in processes:
+            process.join()
+
+    assignment = np.array(incumbent['assignment'][:], dtype=np.int64)
+    clusters = [np.flatnonzero(assignment == cluster_index).tolist() for cluster_index in range(K)]
+    total_time = time.time() - start_time
+    return (clusters, incumbent['objective'].value, sum(incumbent['iterations']), incumbent['time_to_best'].value,
+            total_time)
+
+
+def write_output(file_name, instance_name, objective_value, iterations, time_to_best, total_time, upper_bound=None):
+    with open(file_name, 'a') as output_file:
+        output_file.write(f"Instance file: {instance_name} ")
+        output_file.write(f"Objective value: {objective_value} ")
+        output_file.write(f"Local searches (multi-start): {iterations} ")
+        output_file.write(f"Time to best: {time_to_best} seconds ")
+        output_file.write(f"Total execution time: {total_time} seconds ")
+        if upper_bound is not None:
+            output_file.write(f"Upper bound: {upper_bound} ")
+            output_file.write(f"Gap: {100 * optimality_gap(objective_value, upper_bound):.4f}% ")
+        output_file.write("\n")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Multi-start iterated local search for the k-cluster problem")
+    parser.add_argument('instance')
+    parser.add_argument('--time-limit', type=float, default=600)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--relink', type=float, default=0.3,
+                        help="probability of a path relinking step between elite solutions (0 disables it)")
+    parser.add_argument('--gap', type=float, default=0.0, help="stop once the relative gap to the upper bound is at most this")
+    parser.add_argument('--output', default="Heuristicoutput.txt")
+    args = parser.parse_args()
+
+    N, K, Mk, s = read_input(args.instance)
+    upper_bound = compute_upper_bound(s, Mk)
+    clusters, objective_value, iterations, time_to_best, total_time = multi_start(
+        N, K, Mk, s, time_limit=args.time_limit, workers=args.workers, seed=args.seed, relink_probability=args.relink,
+        upper_bound=upper_bound, gap_tolerance=args.gap)
+    write_output(args.output, args.instance, objective_value, iterations, time_to_best, total_time, upper_bound)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import numpy as np
+
+from instance_io import iter_triangle_blocks, read_header, read_instance, triangle_to_dense
+
+# Cells of the dense (rows, N) block used while building the kNN graph; blocks hold
+# KNN_BLOCK_CELLS // N rows (at least one) whatever the row lengths
+KNN_BLOCK_CELLS = 1 << 24
+
+
+def pair_index(N, i, j):
+    # Position of pair (i, j), i < j, in the packed upper triangle (scipy pdist order)
+    return i * (2 * N - i - 1) // 2 + (j - i - 1)
+
+
+def pair_from_index(N, index):
+    # Inverse of pair_index
+    row_starts = pair_index(N, np.arange(N - 1), np.arange(1, N))
+    i = int(np.searchsorted(row_starts, index, side='right')) - 1
+    return i, int(index - row_starts[i]) + i + 1
+
+
+def item_pair_indices(N, item):
+    # Positions of every pair that contains item, O(N)
+    before = np.arange(item)
+    after = np.arange(item + 1, N)
+    return np.concatenate((pair_index(N, before, item), pair_index(N, item, after)))
+
+
+def upper_triangle(s):
+    # Packed upper triangle of either a dense matrix or a CondensedSimilarity
+    if isinstance(s, CondensedSimilarity):
+        return s.values
+    if isinstance(s, SparseSimilarity):
+        raise TypeError("a SparseSimilarity has no dense triangle, use its edges()")
+    return s[np.triu_indices(len(s), 1)]
+
+
+class CondensedSimilarity:
+    # Symmetric zero-diagonal similarity matrix stored as its packed upper triangle.
+    # Indexing follows NumPy semantics for the patterns the solvers use:
+    # s[i, j], s[i], s[rows], s[:, j], s[:, cols] and s[np.ix_(rows, cols)].
+    def __init__(self, N, values):
+        if len(values) != N * (N - 1) // 2:
+            raise ValueError(f"expected {N * (N - 1) // 2} values for N={N}, got {len(values)}")
+        self.N = N
+        self.values = values
+
+    @classmethod
+    def from_dense(cls, s, dtype=None):
+        values = s[np.triu_indices(len(s), 1)]
+        return cls(len(s), values if dtype is None else values.astype(dtype))
+
+    @property
+    def shape(self):
+        return (self.N, self.N)
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __len__(self):
+        return self.N
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, columns = key + (slice(None),) * (2 - len(key))
+        if isinstance(rows, slice) and isinstance(columns, slice):
+            rows = np.arange(self.N)[rows][:, None]
+            columns = np.arange(self.N)[columns][None, :]
+        elif isinstance(rows, slice):
+            columns = np.asarray(columns)
+            rows = np.arange(self.N)[rows].reshape((-1,) + (1,) * columns.ndim)
+        elif isinstance(columns, slice):
+            rows = np.asarray(rows)
+            columns = np.arange(self.N)[columns]
+            rows = rows[..., None]
+        return self._gather(np.asarray(rows), np.asarray(columns))
+
+    def _gather(self, rows, columns):
+        rows, columns = np.broadcast_arrays(rows, columns)
+        i = np.minimum(rows, columns).astype(np.int64)
+        j = np.maximum(rows, columns).astype(np.int64)
+        diagonal = i == j
+        result = self.values[np.where(diagonal, 0, pair_index(self.N, i, j))]
+        return np.where(diagonal, 0, result)[()]
+
+    def sum(self, axis=None):
+        if axis is None:
+            return 2 * self.values.sum()
+        # Row sums: row i's contiguous segment adds to item i and to items i+1..N-1
+        totals = np.zeros(self.N)
+        start = 0
+        for i in range(self.N - 1):
+            segment = self.values[start:start + self.N - 1 - i]
+            totals[i] += segment.sum()
+            totals[i + 1:] += segment
+            start += self.N - 1 - i
+        return totals
+
+    def astype(self, dtype):
+        return CondensedSimilarity(self.N, self.values.astype(dtype))
+
+    def to_dense(self):
+        return triangle_to_dense(self.N, self.values)
+
+
+def read_condensed(file_name, dtype=None):
+    # Like read_input but without the dense copy; binary files stay memory-mapped
+    # unless a different precision is requested
+    N, K, Mk, values = read_instance(file_name)
+    if dtype is not None and values.dtype != np.dtype(dtype):
+        values = values.astype(dtype)
+    return N, K, Mk, CondensedSimilarity(N, values)
+
+
+class SparseSimilarity:
+    # Symmetric similarity matrix that keeps only the pairs of a kNN graph (the rest read as 0),
+    # stored in CSR form with both (i, j) and (j, i). Memory grows with N * k instead of N^2.
+    # Indexing returns dense NumPy arrays for the same patterns as CondensedSimilarity.
+    # k: neighbours kept per item when built as a kNN graph (each item's k largest similarities are exact)
+    def __init__(self, N, indptr, indices, data, k=None):
+        self.N = N
+        self.k = k
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        # Sorted (row, column) keys for element lookups
+        self._keys = np.repeat(np.arange(N, dtype=np.int64), np.diff(indptr)) * N + indices
+
+    @classmethod
+    def from_pairs(cls, N, rows, columns, values, k=None):
+        # Pairs may come in either orientation and repeat; each unordered pair is kept once
+        i = np.minimum(rows, columns).astype(np.int64)
+        j = np.maximum(rows, columns).astype(np.int64)
+        keep = i != j
+        keys, first = np.unique(i[keep] * N + j[keep], return_index=True)
+        i, j, values = keys // N, keys % N, np.asarray(values)[keep][first]
+        rows = np.concatenate((i, j))
+        columns = np.concatenate((j, i))
+        order = np.lexsort((columns, rows))
+        indptr = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=N), out=indptr[1:])
+        return cls(N, indptr, columns[order], np.concatenate((values, values))[order].astype(np.float64), k)
+
+    @classmethod
+    def from_dense(cls, s, k):
+        # kNN graph of a dense matrix, mainly for comparing against the streamed one
+        N = len(s)
+        masked = np.where(np.eye(N, dtype=bool), -np.inf, s)
+        k = min(k, N - 1)
+        neighbours = np.argpartition(masked, N - k, axis=1)[:, N - k:]
+        rows = np.repeat(np.arange(N), k)
+        return cls.from_pairs(N, rows, neighbours.ravel(), masked[rows, neighbours.ravel()], k)
+
+    @property
+    def shape(self):
+        return (self.N, self.N)
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def __len__(self):
+        return self.N
+
+    def edges(self):
+        # (i, j, s_ij) for the stored pairs with i < j
+        rows = self._keys // self.N
+        upper = rows < self.indices
+        return rows[upper], self.indices[upper], self.data[upper]
+
+    def dense_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        result = np.zeros((len(rows), self.N), dtype=self.data.dtype)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        result[np.repeat(np.arange(len(rows)), lengths), self.indices[positions]] = self.data[positions]
+        return result
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, columns = key + (slice(None),) * (2 - len(key))
+        if isinstance(columns, slice):
+            rows = np.arange(self.N)[rows] if isinstance(rows, slice) else np.asarray(rows)
+            return self.dense_rows(rows.ravel()).reshape(rows.shape + (self.N,))[..., columns]
+        if isinstance(rows, slice):
+            # Symmetric: s[:, columns] is the transpose of s[columns]
+            columns = np.asarray(columns)
+            return np.moveaxis(self.dense_rows(columns.ravel()).reshape(columns.shape + (self.N,)), -1, 0)[rows]
+        return self._gather(np.asarray(rows), np.asarray(columns))
+
+    def _gather(self, rows, columns):
+        rows, columns = np.broadcast_arrays(rows, columns)
+        keys = rows.astype(np.int64) * self.N + columns
+        if not len(self._keys):
+            return np.zeros(keys.shape)[()]
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return np.where(self._keys[positions] == keys, self.data[positions], 0.0)[()]
+
+    def sum(self, axis=None):
+        if axis is None:
+            return self.data.sum()
+        return np.bincount(self._keys // self.N, weights=self.data, minlength=self.N)
+
+    def astype(self, dtype):
+        return SparseSimilarity(self.N, self.indptr, self.indices, self.data.astype(dtype), self.k)
+
+    def to_dense(self):
+        return self.dense_rows(np.arange(self.N))
+
+
+def _merge_top(values, neighbours, new_values, new_neighbours, k):
+    # Keep the k largest of the current and new candidates of every row
+    values = np.concatenate((values, new_values), axis=1)
+    neighbours = np.concatenate((neighbours, new_neighbours), axis=1)
+    if values.shape[1] > k:
+        top = np.argpartition(values, values.shape[1] - k, axis=1)[:, values.shape[1] - k:]
+        values = np.take_along_axis(values, top, axis=1)
+        neighbours = np.take_along_axis(neighbours, top, axis=1)
+    return values, neighbours
+
+
+def stream_knn(file_name, k, block_values=None):
+    # Builds the kNN graph of an instance in one pass over its triangle, reading whole rows in
+    # blocks: row i of a block gives s[i, j] for j > i, which updates both i's and j's top-k lists.
+    # Blocks are capped at block_values // N rows, so peak memory is O(N * k + block_values),
+    # never the N x N matrix.
+    N, K, Mk = read_header(file_name)
+    k = min(k, N - 1)
+    values = np.full((N, k), -np.inf)
+    neighbours = np.zeros((N, k), dtype=np.int64)
+    if block_values is None:
+        block_values = max(N, KNN_BLOCK_CELLS)
+    max_rows = max(1, block_values // N)
+
+    for first_row, last_row, triangle in iter_triangle_blocks(file_name, block_values, max_rows):
+        # Dense block of the upper rows, -inf left of the diagonal
+        lengths = N - 1 - np.arange(first_row, last_row)
+        block_rows = np.repeat(np.arange(last_row - first_row), lengths)
+        block_columns = np.arange(len(triangle)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + \
+            np.repeat(np.arange(first_row, last_row) + 1, lengths)
+        block = np.full((last_row - first_row, N), -np.inf)
+        block[block_rows, block_columns] = triangle
+
+        # Rows: candidates j > i
+        rows = slice(first_row, last_row)
+        values[rows], neighbours[rows] = _merge_top(values[rows], neighbours[rows], block,
+                                                    np.broadcast_to(np.arange(N), block.shape), k)
+        # Columns: candidates i < j from this block
+        columns = block.T
+        candidates = np.broadcast_to(np.arange(first_row, last_row), columns.shape)
+        if columns.shape[1] > k:
+            top = np.argpartition(columns, columns.shape[1] - k, axis=1)[:, columns.shape[1] - k:]
+            columns = np.take_along_axis(columns, top, axis=1)
+            candidates = np.take_along_axis(candidates, top, axis=1)
+        values, neighbours = _merge_top(values, neighbours, columns, candidates, k)
+
+    rows = np.repeat(np.arange(N), k)
+    kept = np.isfinite(values.ravel())
+    s = SparseSimilarity.from_pairs(N, rows[kept], neighbours.ravel()[kept], values.ravel()[kept], k)
+    return N, K, Mk, s
+
+
+def stream_objective(file_name, clusters, block_values=None):
+    # Exact objective of a solution, summed over the full triangle in one streaming pass
+    N = read_header(file_name)[0]
+    assignment = np.full(N, -1, dtype=np.int64)
+    for cluster_index, cluster in enumerate(clusters):
+        assignment[cluster] = cluster_index
+    objective_value = 0.0
+    for first_row, last_row, triangle in iter_triangle_blocks(file_name, block_values or KNN_BLOCK_CELLS):
+        lengths = N - 1 - np.arange(first_row, last_row)
+        rows = np.repeat(np.arange(first_row, last_row), lengths)
+        columns = np.arange(len(triangle)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + rows + 1
+        same = (assignment[rows] >= 0) & (assignment[rows] == assignment[columns])
+        objective_value += triangle[same].sum()
+    return objective_value
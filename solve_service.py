@@ -0,0 +1,341 @@
+import argparse
+import gc
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from batch_runner import SOLVER_SCRIPTS, load_script, run_solver
+from instance_io import read_input
+from instrumentation import Trace
+
+DEFAULT_SOCKET = '/tmp/kcluster_solver.sock'
+DEFAULT_CACHE_MB = 1024
+HASH_CHUNK_BYTES = 1 << 20
+MIP_SOLVERS = ('F1', 'F2', 'compact')
+# Request solver names besides the SOLVER_SCRIPTS keys
+SOLVER_ALIASES = {'heuristic': '2o3'}
+
+
+def content_hash(file_name):
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as instance_file:
+        for chunk in iter(lambda: instance_file.read(HASH_CHUNK_BYTES), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class InstanceCache:
+    # Parsed instances (dense s) in shared memory, keyed by the SHA-256 of the instance file, so the
+    # worker processes attach to them instead of parsing. Least recently used entries are unlinked
+    # once the total size exceeds capacity_bytes; entries used by a running job are never evicted.
+    def __init__(self, capacity_bytes):
+        self.capacity_bytes = capacity_bytes
+        self.entries = OrderedDict()  # hash -> {'memory', 'N', 'K', 'Mk', 'users'}
+        self.file_hashes = {}  # (path, size, mtime) -> hash, unchanged files are not read again
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, file_name):
+        # Returns (hash, (shared memory name, N, K, Mk), cached) and marks the entry in use
+        status = os.stat(file_name)
+        file_key = (os.path.abspath(file_name), status.st_size, status.st_mtime_ns)
+        key = self.file_hashes.get(file_key) or content_hash(file_name)
+        self.file_hashes[file_key] = key
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry['users'] += 1
+                self.hits += 1
+                return key, (entry['memory'].name, entry['N'], entry['K'], entry['Mk']), True
+
+        # Parse outside the lock; a concurrent miss on the same instance keeps the first copy
+        N, K, Mk, s = read_input(file_name)
+        memory = shared_memory.SharedMemory(create=True, size=max(1, s.nbytes))
+        np.ndarray(s.shape, dtype=np.float64, buffer=memory.buf)[:] = s
+        with self.lock:
+            self.misses += 1
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = {'memory': memory, 'N': N, 'K': K, 'Mk': Mk, 'users': 0}
+                self.entries[key] = entry
+                self.size_bytes += memory.size
+            else:
+                memory.close()
+                memory.unlink()
+            self.entries.move_to_end(key)
+            entry['users'] += 1
+            self._evict()
+            return key, (entry['memory'].name, N, K, Mk), False
+
+    def release(self, key):
+        with self.lock:
+            self.entries[key]['users'] -= 1
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        for key in list(self.entries):
+            if self.size_bytes <= self.capacity_bytes:
+                break
+            if self.entries[key]['users'] == 0:
+                memory = self.entries.pop(key)['memory']
+                self.size_bytes -= memory.size
+                memory.close()
+                memory.unlink()
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'size_mb': self.size_bytes / (1 << 20),
+                    'capacity_mb': self.capacity_bytes / (1 << 20), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            for entry in self.entries.values():
+                entry['memory'].close()
+                entry['memory'].unlink()
+            self.entries.clear()
+            self.size_bytes = 0
+
+
+class _StreamingTrace(Trace):
+    # Trace that also sends every new incumbent to the service while the solver runs
+    def __init__(self, results, job_id):
+        super().__init__()
+        self.results = results
+        self.job_id = job_id
+
+    def record(self, objective, move_type, move_count, timestamp=None):
+        super().record(objective, move_type, move_count, timestamp)
+        self.results.put((self.job_id, 'incumbent', self.events[-1]))
+
+
+def _serve_worker(jobs, results):
+    # Warm worker: every solver script (and with them mip and the CBC library) is imported once,
+    # then jobs run until None arrives. The instance is used in place in shared memory, read-only.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the service shuts the workers down itself
+    for file_name in set(SOLVER_SCRIPTS.values()):
+        load_script(file_name)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, (memory_name, N, K, Mk), solver, time_limit, options = job
+        memory = shared_memory.SharedMemory(name=memory_name)
+        s = trace = None
+        try:
+            s = np.ndarray((N, N), dtype=np.float64, buffer=memory.buf)
+            s.flags.writeable = False
+            trace = None if solver in MIP_SOLVERS else _StreamingTrace(results, job_id)
+            result = run_solver(solver, N, K, Mk, s, time_limit, trace=trace, **options)
+            results.put((job_id, 'result', result))
+        except Exception as error:
+            results.put((job_id, 'error', f"{type(error).__name__}: {error}"))
+        finally:
+            s = trace = None
+            gc.collect()  # drop views of the buffer left in reference cycles before closing it
+            memory.close()
+
+
+class SolveService:
+    # Warm pool of solver processes plus the instance cache. solve() queues a job and yields
+    # ('accepted', info), ('incumbent', (time, objective, move type, moves)) events while a
+    # heuristic runs, then ('result', dict) or ('error', text)
+    def __init__(self, workers=None, cache_bytes=DEFAULT_CACHE_MB << 20):
+        self.cache = InstanceCache(cache_bytes)
+        self.jobs = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.pending = {}  # job id -> (queue.Queue of its events, cache key)
+        self.job_ids = itertools.count()
+        # Start the tracker before forking, so the workers attaching to the cache share it instead
+        # of starting their own (which would unlink the cached instances when a worker exits)
+        resource_tracker.ensure_running()
+        # Not daemons: the multi-start solver starts processes of its own
+        self.processes = [multiprocessing.Process(target=_serve_worker, args=(self.jobs, self.results))
+                          for _ in range(workers or os.cpu_count())]
+        for process in self.processes:
+            process.start()
+        self.router = threading.Thread(target=self._route, daemon=True)
+        self.router.start()
+
+    def _route(self):
+        # Hand worker events to the request waiting for them. A finished job releases its cache
+        # entry here, so the instance stays pinned until the worker is done even if the client left
+        while True:
+            event = self.results.get()
+            if event is None:
+                break
+            job_id, kind, payload = event
+            events, key = self.pending[job_id]
+            if kind != 'incumbent':
+                del self.pending[job_id]
+                self.cache.release(key)
+            events.put((kind, payload))
+
+    def solve(self, instance, solver, time_limit, options=None):
+        solver = SOLVER_ALIASES.get(solver, solver)
+        if solver not in SOLVER_SCRIPTS:
+            raise ValueError(f"unknown solver {solver}, expected one of {sorted(SOLVER_SCRIPTS)}")
+        start_time = time.time()
+        key, instance_data, cached = self.cache.acquire(instance)
+        job_id = next(self.job_ids)
+        events = queue.Queue()
+        self.pending[job_id] = (events, key)
+        self.jobs.put((job_id, instance_data, solver, time_limit, options or {}))
+        yield 'accepted', {'job': job_id, 'instance_hash': key, 'cached': cached, 'load_time': time.time() - start_time}
+        while True:
+            kind, payload = events.get()
+            yield kind, payload
+            if kind != 'incumbent':
+                break
+
+    def close(self):
+        for _ in self.processes:
+            self.jobs.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.results.put(None)
+        self.router.join()
+        self.cache.close()
+
+
+def _json_default(value):
+    # numpy scalars and arrays in solver results
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # Newline-delimited JSON. Request: {"instance": path, "solver": "2o3", "time_limit": 60,
+    # "options": {...}} or {"command": "stats"}. Reply: one {"event": ...} line per event, the last
+    # one being "result" or "error". Several requests may follow each other on one connection.
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if request.get('command') == 'stats':
+                    self._send('stats', self.server.service.cache.stats())
+                    continue
+                for kind, payload in self.server.service.solve(request['instance'], request.get('solver', '2o3'),
+                                                               float(request.get('time_limit', 60)),
+                                                               request.get('options')):
+                    if kind == 'incumbent':
+                        payload = dict(zip(('time', 'objective', 'move_type', 'move_count'), payload))
+                    elif kind == 'error':
+                        payload = {'error': payload}
+                    self._send(kind, payload)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as error:  # bad request: report it and keep the connection
+                self._send('error', {'error': f"{type(error).__name__}: {error}"})
+
+    def _send(self, kind, payload):
+        self.wfile.write((json.dumps(dict(payload, event=kind), default=_json_default) + '\n').encode())
+        self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(address=DEFAULT_SOCKET, workers=None, cache_mb=DEFAULT_CACHE_MB):
+    # address: Unix socket path, or a port number for TCP on localhost. Runs until SIGINT/SIGTERM
+    service = SolveService(workers, cache_mb << 20)
+    if isinstance(address, int):
+        server = _TCPServer(('127.0.0.1', address), _RequestHandler)
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = _UnixServer(address, _RequestHandler)
+    server.service = service
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Serving on {address} with {len(service.processes)} workers", flush=True)
+    try:
+        while server_thread.is_alive():
+            server_thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        server.shutdown()
+    finally:
+        server.server_close()
+        service.close()
+        if not isinstance(address, int) and os.path.exists(address):
+            os.remove(address)
+
+
+def solve(instance, solver='2o3', time_limit=60, address=DEFAULT_SOCKET, options=None, on_event=None):
+    # Client: sends one request and returns the final result event; on_event(event dict) sees the
+    # accepted and incumbent events as they arrive. Raises RuntimeError on a solver error.
+    if isinstance(address, int):
+        connection = socket.create_connection(('127.0.0.1', address))
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(address)
+    with connection, connection.makefile('rwb') as stream:
+        request = {'instance': os.path.abspath(instance), 'solver': solver, 'time_limit': time_limit,
+                   'options': options or {}}
+        stream.write((json.dumps(request) + '\n').encode())
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if event['event'] == 'result':
+                return event
+            if event['event'] == 'error':
+                raise RuntimeError(event['error'])
+            if on_event is not None:
+                on_event(event)
+    raise RuntimeError("connection closed before the result")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Long-running k-cluster solve service with warm worker processes "
+                                                 "and a shared-memory instance cache, and its client")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="start the service")
+    serve_parser.add_argument('--workers', type=int, default=None, help="warm solver processes (default: one per CPU)")
+    serve_parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_MB,
+                              help="shared memory kept for parsed instances")
+    solve_parser = commands.add_parser('solve', help="send an instance to a running service")
+    solve_parser.add_argument('instance')
+    solve_parser.add_argument('--solver', default='2o3', choices=sorted(SOLVER_SCRIPTS) + sorted(SOLVER_ALIASES))
+    solve_parser.add_argument('--time-limit', type=float, default=60)
+    for command_parser in (serve_parser, solve_parser):
+        command_parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+        command_parser.add_argument('--port', type=int, default=None, help="use TCP on localhost instead")
+    args = parser.parse_args()
+
+    address = args.port if args.port is not None else args.socket
+    if args.command == 'serve':
+        serve(address, args.workers, args.cache_mb)
+    else:
+        result = solve(args.instance, args.solver, args.time_limit, address,
+                       on_event=lambda event: print(json.dumps(event), flush=True))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()